@@ -0,0 +1,244 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), batch solver: jobs are solved by a
+# pool of worker processes, each with its own time and/or iteration
+# budget, without any graphics; the results are written as JSON lines
+# (one per job, in the order the jobs finish). Jobs come from
+#
+# - a directory: every instance file in it (.tsp or .xy, see
+#   TSP_instance.py) is a job with the budget of the command line
+# - a file or stdin ("-") with one job per line as JSON object
+# - a local (Unix) socket: clients send jobs as JSON lines and get the
+#   results of their jobs back on the same connection
+#
+# A job is a JSON object with the cities given as instance file, as N
+# random cities or as list of coordinates, and optional settings, e.g.
+#
+#   {"id": "a", "instance": "att532.tsp", "time": 60}
+#   {"id": "b", "N": 2000, "seed": 1, "iters": 1000000, "schedule": "geometric"}
+#   {"id": "c", "cities": [[0, 0], [3, 1], [2, 5], [1, 4]], "iters": 10000}
+#
+#   python TSP_batch.py instances/ --time 60 --output results.jsonl
+#   python TSP_batch.py jobs.jsonl --workers 4
+#   python TSP_batch.py --socket /tmp/tsp.sock
+#
+########################################################################
+#
+# Import packages:
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import SocketServer
+import sys
+import tempfile
+import threading
+import numpy as np
+import TSP_engine
+import TSP_instance
+import TSP_stats
+
+########################################################################
+# Global settings:
+WORKERS = multiprocessing.cpu_count()  # number of worker processes
+TIME = 60.0          # time budget (in seconds) per engine of a job without budget
+ENGINES = ("simann",)  # engines run for a job, see TSP_engine.ENGINES
+EXTENSIONS = (".tsp", TSP_instance.RAW_EXTENSION)  # instance files taken from a directory
+JOB_KEYS = ("id", "instance", "N", "seed", "cities", "iters", "time", "engines", "start", "schedule", "polish", "polish_every", "stop")
+
+
+########################################################################
+# Jobs:
+def solve(job):
+    # solve one job (dictionary, see above) in a worker process; returns
+    # result as dictionary: id and status ("ok" or "error" with message),
+    # results of TSP_engine.run_headless() without the cities and the time
+    # per phase and the moves of the last engine as "stats"
+    result = {"id": job.get("id"), "status": "error"}
+    if "error" in job:
+        # line which read_jobs() couldn't parse
+        result["error"] = job["error"]
+        return result
+    temp = None
+    try:
+        unknown = set(job) - set(JOB_KEYS)
+        if unknown:
+            raise ValueError("unknown job keys: " + ", ".join(sorted(unknown)))
+        if not (job.get("iters") or job.get("time")):
+            raise ValueError("job needs iters and/or time")
+        instance = None
+        if "instance" in job:
+            instance = TSP_instance.load(job["instance"])
+        elif "cities" in job:
+            # given coordinates are written to a raw file, so they are
+            # normalised and measured like the cities of an instance file
+            temp = tempfile.mkdtemp(prefix="TSP_job_")
+            filename = os.path.join(temp, "job" + TSP_instance.RAW_EXTENSION)
+            np.array(job["cities"], dtype="<f8").reshape(-1, 2).tofile(filename)
+            instance = TSP_instance.load(filename)
+        elif "N" not in job:
+            raise ValueError("job needs instance, cities or N")
+        stats = TSP_stats.Stats()
+        results = TSP_engine.run_headless(job.get("N"), job.get("iters"), job.get("time"), job.get("seed"),
+                                          job.get("engines", ENGINES), start=job.get("start", "random"),
+                                          stats=stats, schedule=job.get("schedule"), instance=instance,
+                                          polish=job.get("polish", TSP_engine.POLISH),
+                                          polish_every=job.get("polish_every", TSP_engine.POLISH_EVERY),
+                                          stop=job.get("stop", True))
+        results.pop("cities", None)
+        if "cities" in job:
+            results.pop("instance")
+            results["name"] = job.get("id")
+        results["stats"] = stats.Record(stats.engines)
+        result.update(results)
+        result["status"] = "ok"
+    except Exception as error:
+        result["error"] = type(error).__name__ + ": " + str(error)
+    finally:
+        if temp is not None:
+            shutil.rmtree(temp, ignore_errors=True)
+    return result
+
+def _solve(args):
+    # job with default budget, for Pool.imap_unordered()
+    job, iters, time_budget = args
+    if not (job.get("iters") or job.get("time")):
+        job = dict(job, iters=iters, time=time_budget)
+    return solve(job)
+
+def parse_job(line, number):
+    # job from a line of JSON, its id defaults to the line number
+    job = json.loads(line)
+    if not isinstance(job, dict):
+        raise ValueError("job is not a JSON object")
+    job.setdefault("id", number)
+    return job
+
+def read_jobs(lines):
+    # jobs from lines of JSON (file, stdin, socket); a line which isn't a
+    # valid job gives a failed job instead, so the others still run
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield parse_job(line, number)
+        except ValueError as error:
+            yield {"id": number, "error": "ValueError: " + str(error)}
+
+def directory_jobs(directory):
+    # one job per instance file in directory, id is the file name
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1] in EXTENSIONS:
+            yield {"id": name, "instance": os.path.join(directory, name)}
+
+def write_result(result, output):
+    # write result as JSON line and flush, so it can be read at once
+    output.write(json.dumps(result, sort_keys=True) + "\n")
+    output.flush()
+
+
+########################################################################
+# Batch run and service:
+def run_batch(jobs, output=sys.stdout, workers=WORKERS, iters=None, time_budget=TIME):
+    # solve jobs (iterable of dictionaries) in a pool of worker processes,
+    # jobs without budget get iters and/or time_budget; results are
+    # written to output as soon as a job is done; returns number of failed
+    # jobs
+    pool = multiprocessing.Pool(workers)
+    failed = 0
+    try:
+        for result in pool.imap_unordered(_solve, ((job, iters, time_budget) for job in jobs)):
+            failed += result["status"] != "ok"
+            write_result(result, output)
+    finally:
+        pool.terminate()
+    return failed
+
+
+class JobHandler(SocketServer.StreamRequestHandler):
+    # one client connection: jobs are read line by line and go to the pool
+    # of the server, results are sent back as they come in; the connection
+    # is closed when the client has sent everything (shut down its side)
+    # and all of its jobs are done
+
+    def handle(self):
+        lock = threading.Lock()
+
+        def send(result):
+            with lock:
+                try:
+                    write_result(result, self.wfile)
+                except IOError:
+                    pass    # client has gone, the job is done anyway
+
+        pending = []
+        for job in read_jobs(iter(self.rfile.readline, "")):
+            pending.append(self.server.pool.apply_async(_solve, ((job, self.server.iters, self.server.time_budget),), callback=send))
+        for job in pending:
+            job.wait()
+
+
+class JobServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, address, workers=WORKERS, iters=None, time_budget=TIME):
+        if os.path.exists(address):
+            os.remove(address)      # left over from an earlier server
+        SocketServer.UnixStreamServer.__init__(self, address, JobHandler)
+        self.pool = multiprocessing.Pool(workers)
+        self.iters, self.time_budget = iters, time_budget
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        self.pool.terminate()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def serve(address, workers=WORKERS, iters=None, time_budget=TIME):
+    # run job server on a Unix socket until interrupted (Ctrl-C or SIGTERM)
+    server = JobServer(address, workers, iters, time_budget)
+    signal.signal(signal.SIGTERM, _stop)
+    print "Serving TSP jobs on", address, "with", workers, "worker(s)"
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+########################################################################
+# Command line:
+def main():
+    parser = argparse.ArgumentParser(description="TSP: solve jobs in a pool of worker processes, results as JSON lines")
+    parser.add_argument("jobs", nargs="?", help="directory with instance files, or file with jobs as JSON lines (-: stdin)")
+    parser.add_argument("--socket", help="serve jobs on this Unix socket instead")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="number of worker processes (default: %(default)s)")
+    parser.add_argument("--iters", type=int, help="iterations per engine for jobs without budget")
+    parser.add_argument("--time", type=float, help="time budget in seconds per engine for jobs without budget (default: %s if no --iters)" % TIME)
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    args = parser.parse_args()
+    if bool(args.jobs) == bool(args.socket):
+        parser.error("give either jobs or --socket")
+    time_budget = args.time if args.time or args.iters else TIME
+    if args.socket:
+        serve(args.socket, args.workers, args.iters, time_budget)
+        return
+    if os.path.isdir(args.jobs):
+        jobs = directory_jobs(args.jobs)
+    else:
+        jobs = read_jobs(sys.stdin if args.jobs == "-" else open(args.jobs))
+    output = open(args.output, "w") if args.output else sys.stdout
+    failed = run_batch(jobs, output, args.workers, args.iters, time_budget)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
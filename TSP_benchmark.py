@@ -0,0 +1,191 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), benchmark of the solver engines:
+# direct sampling and simulated annealing run on seeded random instances
+# for a range of N, recorded are the throughput (iterations per second),
+# the time to reach a target tour length and the final tour length; the
+# target only depends on the number of cities (see target_length()), and
+# the results are written as JSON lines (one line per instance and
+# engine), so releases can be compared:
+#
+#   python TSP_benchmark.py --output bench_v10.jsonl
+#   python TSP_benchmark.py --output bench_new.jsonl --compare bench_v10.jsonl
+#
+########################################################################
+#
+# Import packages:
+import argparse
+import datetime
+import json
+import math
+import platform
+import subprocess
+import sys
+import timeit
+import numpy as np
+import TSP_engine
+from TSP_comparism_v10 import VERSION
+
+########################################################################
+# Global settings:
+SIZES = (10, 20, 50, 100, 200, 500, 1000, 2000)  # numbers of cities
+SEEDS = (1, 2, 3)    # random seeds, one instance per N and seed
+ITERS = 200000       # iterations per engine and instance
+TIME = 20.0          # time budget (in seconds) per engine and instance
+TARGET = 0.2         # target tour length is (1 + TARGET) * expected length of the shortest tour, see target_length()
+TOLERANCE = 0.15     # relative loss of iterations per second or time to target reported as regression by --compare
+LENGTH_TOLERANCE = 0.01  # relative increase of final tour length reported as regression by --compare
+BHH = 0.7124         # shortest tour of N random cities in area A is BHH * sqrt(N * A) for large N (Beardwood-Halton-Hammersley)
+BOUNDARY = 1.5       # relative excess of the shortest tour for finite N is about BOUNDARY / sqrt(N) (boundary of the square; fitted to tours found for N = 10 ... 200)
+
+
+########################################################################
+# Helper functions:
+def metadata():
+    # description of code version and machine, stored with every result
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"version": VERSION, "commit": commit, "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "platform": platform.platform()}
+
+def run_engine(name, cities, dist, seed, iters, time_budget, block=TSP_engine.BLOCK, start="random"):
+    # run engine like headless mode does, returns result and trace of the
+    # shortest tour length as list of (time, iteration, length), one entry
+    # per chunk of TSP_engine.CHUNK iterations with an improvement; name
+    # may give a cooling schedule for simulated annealing, e.g.
+    # "simann:geometric" (see TSP_cooling.py)
+    engine = TSP_engine.make_engine(name.split(":")[0], cities, dist, seed, block, start, (name.split(":") + [None])[1])
+    trace = [(0.0, 0, engine.best_energy)]
+    begin = timeit.default_timer()
+    elapsed = 0.0
+    while engine.iters < iters and elapsed < time_budget:
+        improved = engine.Run(min(TSP_engine.CHUNK, iters - engine.iters))
+        elapsed = timeit.default_timer() - begin
+        if improved:
+            trace.append((elapsed, engine.iters, engine.best_energy))
+    result = {"engine": name, "iters": engine.iters, "time": elapsed,
+              "iters_per_sec": engine.iters / elapsed if elapsed > 0 else None,
+              "length": engine.best_energy, "best_iter": engine.best_iter}
+    return result, trace
+
+def target_length(N, target=TARGET):
+    # target tour length for N random cities of TSP_engine.generate_cities()
+    # (in a square of side 0.95), the same for every seed and release:
+    # (1 + target) times the expected length of the shortest tour
+    area = 0.95 ** 2
+    return (1.0 + target) * BHH * math.sqrt(N * area) * (1.0 + BOUNDARY / math.sqrt(N))
+
+def time_to_target(trace, target):
+    # time and iteration (at chunk resolution) at which the tour length
+    # first reached the target, (None, None) if it never did
+    for elapsed, iters, length in trace:
+        if length <= target:
+            return elapsed, iters
+    return None, None
+
+def benchmark(sizes=SIZES, seeds=SEEDS, engines=("direct", "simann"), iters=ITERS, time_budget=TIME, block=TSP_engine.BLOCK, start="random", verbose=False):
+    # run all engines on all instances, returns list of records (dicts)
+    meta = metadata()
+    records = []
+    for N in sizes:
+        for seed in seeds:
+            cities = TSP_engine.generate_cities(N, seed)
+            dist = TSP_engine.make_distances(cities)
+            runs = [run_engine(name, cities, dist, seed, iters, time_budget, block, start) for name in engines]
+            target = target_length(N)
+            for result, trace in runs:
+                result["time_to_target"], result["iters_to_target"] = time_to_target(trace, target)
+                result.update({"N": N, "seed": seed, "target": target, "block": block, "start": start})
+                result.update(meta)
+                records.append(result)
+                if verbose: print_record(result)
+    return records
+
+def label(name):
+    # description of engine (with cooling schedule)
+    name, schedule = (name.split(":") + [None])[:2]
+    return TSP_engine.ENGINES[name] + (" (" + schedule + ")" if schedule else "")
+
+def print_record(record):
+    # print one benchmark result
+    ttt = record["time_to_target"]
+    print label(record["engine"]) + ":", "N =", record["N"], "/ seed:", record["seed"], \
+          "/ iters/sec:", int(round(record["iters_per_sec"] or 0)), "/ min. tour length:", round(record["length"], 5), \
+          "/ time to target:", "-" if ttt is None else str(round(ttt, 3)) + " s"
+
+def save_records(records, filename):
+    # save benchmark results as JSON lines
+    with open(filename, "w") as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+    return filename
+
+def load_records(filename):
+    # read benchmark results written by save_records()
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(old, new, tolerance=TOLERANCE, length_tolerance=LENGTH_TOLERANCE):
+    # compare two benchmark runs instance by instance, prints ratios of
+    # iterations per second, final tour lengths and times to target (new /
+    # old); returns number of instances where the throughput dropped or
+    # the time to target grew by more than tolerance, or the final tour got
+    # longer by more than length_tolerance (times to target are only
+    # compared for the same target, i.e. results of this release on)
+    regressions = 0
+    reference = dict(((r["N"], r["seed"], r["engine"]), r) for r in old)
+    for r in new:
+        o = reference.get((r["N"], r["seed"], r["engine"]))
+        if o is None or not (o["iters_per_sec"] and r["iters_per_sec"]):
+            continue
+        flags = []
+        speed = r["iters_per_sec"] / o["iters_per_sec"]
+        if speed < 1.0 - tolerance:
+            flags.append("SLOWER")
+        length = r["length"] / o["length"]
+        if length > 1.0 + length_tolerance:
+            flags.append("LONGER")
+        ttt = "-"
+        if o["target"] == r["target"] and o["time_to_target"]:
+            if r["time_to_target"] is None:
+                flags.append("TARGET MISSED")
+            else:
+                ttt = round(r["time_to_target"] / o["time_to_target"], 3)
+                if ttt > 1.0 + tolerance:
+                    flags.append("LATER AT TARGET")
+        regressions += bool(flags)
+        print label(r["engine"]) + ":", "N =", r["N"], "/ seed:", r["seed"], \
+              "/ iters/sec ratio:", round(speed, 3), "/ tour length ratio:", round(length, 5), \
+              "/ time to target ratio:", ttt, "/ " + ", ".join(flags) if flags else ""
+    return regressions
+
+
+########################################################################
+# Command line:
+def main():
+    parser = argparse.ArgumentParser(description="TSP: benchmark of direct sampling and simulated annealing")
+    parser.add_argument("--sizes", default=",".join(str(N) for N in SIZES), help="comma separated numbers of cities, default: %(default)s")
+    parser.add_argument("--seeds", default=",".join(str(seed) for seed in SEEDS), help="comma separated random seeds, default: %(default)s")
+    parser.add_argument("--engines", default="direct,simann", help="comma separated solvers, simann:SCHEDULE for a cooling schedule other than the default one, default: %(default)s")
+    parser.add_argument("--iters", type=int, default=ITERS, help="iterations per engine and instance (default: %(default)s)")
+    parser.add_argument("--time", type=float, default=TIME, help="time budget in seconds per engine and instance (default: %(default)s)")
+    parser.add_argument("--block", type=int, default=TSP_engine.BLOCK, help="block size for direct sampling (default: %(default)s)")
+    parser.add_argument("--start", default="random", choices=("random", "curve"), help="initial tour for simulated annealing, default: %(default)s")
+    parser.add_argument("--output", help="save results as JSON lines file")
+    parser.add_argument("--compare", help="compare with results of an earlier run (JSON lines file)")
+    args = parser.parse_args()
+    records = benchmark([int(N) for N in args.sizes.split(",")], [int(seed) for seed in args.seeds.split(",")],
+                        args.engines.split(","), args.iters, args.time, args.block, args.start, verbose=True)
+    if args.output:
+        save_records(records, args.output)
+    if args.compare:
+        regressions = compare(load_records(args.compare), records)
+        if regressions:
+            print regressions, "regression(s) in iterations per second, tour length or time to target"
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
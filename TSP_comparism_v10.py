@@ -8,17 +8,25 @@
 #
 # Version 1.0
 #
+# The solvers live in TSP_engine.py; run with --headless (see --help) to
+# use them without any graphics, pygame and matplotlib are only imported
+# when the GUI or a plot is needed.
+#
 ########################################################################
 #
 # Import packages:
-import random
-import math
-import pygame
-from pygame.locals import *
+import argparse
+import os
 import timeit
 import time
 import datetime
-import matplotlib.pyplot as plt
+import TSP_engine
+import TSP_stats
+import TSP_record
+import TSP_cooling
+import TSP_instance
+import TSP_stopping
+pygame = None  # imported by init_display()
 
 ########################################################################
 # Global settings:
@@ -32,9 +40,24 @@ FONTSIZE = 20        # font size for control section buttons
 VERBOSE = False      # level of chattiness
 SAVEPLOT = True      # save plot of tour length vs iteration (True) or only display it (False)
 SLEEP = 0            # delay (in seconds) after plotting new configuration
+FPS = 30             # maximum number of frames per second
+STEPS = 100          # iterations per solver between checks of the frame time
+SPEED_TIME = 1.0     # interval (in seconds) between updates of the speed display
+STATS = None         # TSP_stats.Stats if statistics are written (--stats)
+CHECKPOINT = None    # file for checkpoints of the simulation state (--checkpoint)
+SCHEDULE = None      # cooling schedule for simulated annealing (None: default for number of cities)
+INSTANCE = None      # TSP_instance.Instance shown at start instead of random cities (--instance)
+FRAME_BLOCK = 256    # maximum block size for direct sampling in the GUI, scoring a block has to fit into a frame
 N = 20               # initial number of cities
 SEED = None          # random seed
+BLOCK = TSP_engine.BLOCK  # number of random tours scored at once by direct sampling
+POLISH_EVERY = TSP_engine.POLISH_EVERY  # iterations between polishings of the best tour of simulated annealing (0: never)
+POLISH = True        # polish the best tour of simulated annealing when the simulation stops by itself (--no-polish)
+ITERS = None         # iteration budget of the simulation (None: no limit)
+TIME_BUDGET = None   # budget of solver time (in seconds) of the simulation (None: no limit)
+STOP = True          # stop the simulation when simulated annealing has converged, see TSP_stopping.py
 VERSION = "1.0"      # version
+FONTS = {}           # cache of loaded fonts, see get_font()
 
 
 ########################################################################
@@ -51,38 +74,55 @@ COLORS = {"WHITE": (255, 255, 255), "RED": (255, 0, 0), "GREEN": (0, 255, 0),
 
 ########################################################################
 # Helper functions:
-def distance(x, y):
-    # get Euclidean distance between two points (cities) in 2D space
-    return math.sqrt((x[0] - y[0])**2 + (x[1] - y[1])**2)
-
-def tour_length(cities, N):
-    # get total tour length for current sequence of cities
-    assert len(cities) == N, "WTF?? " + str(len(cities)) + " vs " + str(N)
-    return sum(distance(cities[k + 1], cities[k]) for k in range(N - 1)) + distance(cities[0], cities[N - 1])
-
 def draw_text(surface, font, text, position, color):
     # draw user-defined text in pygame graphics surface
     lable = font.render(text, 1, color)
     surface.blit(lable, position)
 
-def generate_cities(N):
-    # generate positions for N cities randomly in range .025 <= x <= .975
-    # and .025 <= y <= .975 (leave margins at all sides for aesthetics
-    # reasons)
-    random.seed(SEED)
-    cities = [(.025 + random.uniform(0.0, 0.95), .025 + random.uniform(0.0, 0.95)) for i in range(N)]
-    random.seed()
-    return cities[:]
-
-def change_N(N):
-    # change number of cities, so various variables have to be reset
-    iters, siters, diters = 0, 0, 0
-    d_energy_min, s_energy_min = float('inf'), 10000.
-    beta, n_accept = 1.0, 0
-    dcities = generate_cities(N)
-    scities = dcities[:]
+def get_font(name, size):
+    # pygame font, loaded only once per name and size (SysFont searches
+    # the installed fonts every time)
+    if (name, size) not in FONTS:
+        FONTS[name, size] = pygame.font.SysFont(name, size)
+    return FONTS[name, size]
+
+def change_N(N, state=None, instance=None):
+    # change number of cities, so various variables have to be reset; or
+    # continue from state saved by save_checkpoint(); or show the cities
+    # of an instance file (TSP_instance.Instance)
+    iters = 0
+    if state is not None:
+        cities = state["cities"]
+    elif instance is not None:
+        N, cities = instance.N, instance.cities
+        if VERBOSE: print "Instance", TSP_instance.describe(instance)
+    else:
+        cities = TSP_engine.generate_cities(N, SEED)
+    dist = TSP_engine.make_distances(cities)
+    dengine = TSP_engine.make_engine("direct", cities, dist, SEED, min(BLOCK, FRAME_BLOCK))
+    sengine = TSP_engine.make_engine("simann", cities, dist, SEED, schedule=SCHEDULE, polish_every=POLISH_EVERY)
+    if state is not None:
+        dengine.SetState(state["direct"])
+        sengine.SetState(state["simann"])
+        iters = state["iters"]
+    if STATS is not None:
+        dengine.CountMoves()
+        sengine.CountMoves()
     if VERBOSE: print "Simulating", N, "cities."
-    return N, dcities, scities, iters, siters, diters, d_energy_min, s_energy_min, beta, n_accept, timeit.default_timer(), {"direct": {"iters": [], "lengths": []}, "simann": {"iters": [], "lengths": []}}
+    return N, cities, dengine, sengine, iters, timeit.default_timer(), TSP_record.Recorder()
+
+def make_criteria():
+    # stopping criteria of the simulation, for a new set of cities
+    if STOP:
+        return TSP_stopping.Criteria(ITERS, TIME_BUDGET)
+    return TSP_stopping.Criteria(ITERS, TIME_BUDGET, 0, 0)
+
+def save_checkpoint(N, cities, dengine, sengine, iters):
+    # save state of both simulations to CHECKPOINT (if given), see --resume
+    if CHECKPOINT:
+        TSP_engine.save_checkpoint({"N": N, "seed": SEED, "cities": cities, "iters": iters,
+                                    "direct": dengine.GetState(), "simann": sengine.GetState()}, CHECKPOINT)
+        if VERBOSE: print "Checkpoint saved, filename:", CHECKPOINT
 
 def get_filename(N, iters):
     # generate file (without extension),
@@ -97,57 +137,42 @@ def save_image(surface, N, iters):
     pygame.image.save(surface, filename)
     return filename
 
-def make_plot(plot_data, N, iters):
+def make_plot(log, N, iters):
     # generate plot of minimal tour length vs iteration number for both
-    # direct sampling and simulated annealing; plot has log-log-scale;
+    # direct sampling and simulated annealing from the convergence log, in
+    # a separate process (see TSP_record.py), so the simulation goes on;
     # plot is saved to file with filename containing N, iteration and
-    # timestamp
-    filename = get_filename(N, iters) + "_plot.png"
-    fig = plt.figure(figsize=(10, 10))
-    ax = fig.add_subplot(1, 1, 1)
-    ax.set_xscale("log")
-    ax.set_yscale("log")
-    xmax = max(plot_data["direct"]["iters"][-1], plot_data["simann"]["iters"][-1])
-    x1 = plot_data["direct"]["iters"]
-    y1 = plot_data["direct"]["lengths"]
-    x2 = plot_data["simann"]["iters"]
-    y2 = plot_data["simann"]["lengths"]
-    if x1[-1] < x2[-1]:
-        x1.append(x2[-1])
-        y1.append(y1[-1])
-    elif x1[-1] > x2[-1]:
-        x2.append(x1[-1])
-        y2.append(y2[-1])
-    plt.plot(x1, y1, color="red", lw=2, label="direct sampling")
-    plt.plot(x2, y2, color="blue", lw=2, label="simulated annealing")
-    plt.legend(loc=3, fontsize=16)
-    plt.xlabel("iteration", fontsize=16)
-    plt.ylabel("minimal tour length", fontsize=16)
-    plt.title("Tour length vs iteration", fontsize=20)
-    if SAVEPLOT:
-        plt.savefig(filename)
-    plt.show()
+    # timestamp; the process plots a copy of the log, the temporary file
+    # of the log is gone when the GUI is closed or N is changed
+    filename = get_filename(N, iters) + "_plot.png" if SAVEPLOT else None
+    log.Flush()
+    TSP_record.plot_in_background(log.filename, filename, copy=True)
     return filename
-
     
 ########################################################################
 # Initialisation:
-start_timer = timeit.default_timer()
-pygame.init()
-helv20 = pygame.font.SysFont("Helvetica", 20)
-helv24 = pygame.font.SysFont("Helvetica", 24)
-# start clock:
-fpsClock = pygame.time.Clock()
-# set display surface for pygame:
-SWIDTH = 2 * SIZE + DELIM_WIDTH
-SHEIGHT = SIZE + STATUS_HEIGHT + STATUS_HEIGHT2 + STATUS_HEIGHT3
-print SWIDTH, SHEIGHT
-surface = pygame.display.set_mode((SWIDTH, SHEIGHT))
-surface.set_alpha(None)
-pygame.display.set_caption("TSP: direct sampling vs simulated annealing, v" + VERSION)
-dcities = generate_cities(N)  # cities for direct sampling
-scities = dcities[:]          # cities for simulated annealing
-
+def init_display():
+    # initialise pygame and open display window, returns display surface
+    global pygame, helv20, helv24, fpsClock
+    import pygame
+    pygame.init()
+    helv20 = get_font("Helvetica", 20)
+    helv24 = get_font("Helvetica", 24)
+    # start clock:
+    fpsClock = pygame.time.Clock()
+    # set display surface for pygame:
+    SWIDTH = 2 * SIZE + DELIM_WIDTH
+    SHEIGHT = SIZE + STATUS_HEIGHT + STATUS_HEIGHT2 + STATUS_HEIGHT3
+    if VERBOSE: print SWIDTH, SHEIGHT
+    surface = pygame.display.set_mode((SWIDTH, SHEIGHT))
+    surface.set_alpha(None)
+    set_caption()
+    return surface
+
+def set_caption(reason=None):
+    # window title, with the reason why the simulation has stopped
+    caption = "TSP: direct sampling vs simulated annealing, v" + VERSION
+    pygame.display.set_caption(caption if reason is None else caption + " - stopped: " + reason)
 
 
 ######################################################################
@@ -161,9 +186,11 @@ class Button():
         self.text = text
         self.color = color
         self.tcolor = tcolor
+        self.label = None
 
     def SetText(self, text):
         self.text = text
+        self.label = None
 
     def PlaceButton(self, surface, x, y):
         self.x = x
@@ -176,9 +203,10 @@ class Button():
         return surface
 
     def ButtonText(self, surface, x, y):
-        font_size = int(self.width // len(self.text))
-        font = pygame.font.SysFont("Arial", FONTSIZE)
-        text = font.render(self.text, 1, self.tcolor)
+        # text is rendered once and reused until it is changed
+        if self.label is None:
+            self.label = get_font("Arial", FONTSIZE).render(self.text, 1, self.tcolor)
+        text = self.label
         surface.blit(text, ((x + self.width/2) - text.get_width()/2, (y + self.height/2) - text.get_height()/2))
         return surface
 
@@ -189,155 +217,207 @@ class Button():
                mouse[1] < self.y + self.height
 
 ########################################################################
-# simulation step for direct sampling, just randomly shuffle cities,
-# i.e. previous configuration has to impact whatsoever on next configuration:
-def direct_sampling(cities):
-    random.shuffle(cities)
-    return cities
-    
+# Renderer, draws only what has changed: everything static (backgrounds,
+# delimiters, labels, buttons) is rendered once into a background
+# surface, the cities once per city set into a transparent layer; a
+# changed part of the window is restored from the background, drawn
+# again and only its rectangle is sent to the display:
+class Renderer():
+
+    def __init__(self, surface, buttons):
+        # buttons: list of (button, x, y)
+        self.surface = surface
+        self.status_rect = pygame.Rect(0, 0, 2 * SIZE + DELIM_WIDTH, STATUS_HEIGHT)
+        self.panel_rects = [pygame.Rect(k * (SIZE + DELIM_WIDTH), STATUS_HEIGHT, SIZE + DELIM_WIDTH, SIZE + STATUS_HEIGHT2 + DELIM_WIDTH) for k in range(2)]
+        self.cities = None
+        self.shown = {}  # values currently on display, per part of window
+        self.background = self.Background(buttons)
+        surface.blit(self.background, (0, 0))
+        pygame.display.flip()
+
+    def Background(self, buttons):
+        # static parts of the window
+        background = self.surface.copy()
+        font = get_font("Helvetica", 24)
+        background.fill(COLORS["WHITE"])
+        background.fill(COLORS["LIGHTYELLOW"], (0, 0, 2 * SIZE + DELIM_WIDTH, STATUS_HEIGHT))
+        background.fill(COLORS["DARKBLUE"], (SIZE, STATUS_HEIGHT, DELIM_WIDTH, SIZE + STATUS_HEIGHT2))
+        background.fill(COLORS["DARKBLUE"], (0, STATUS_HEIGHT, DELIM_WIDTH, SIZE + STATUS_HEIGHT2))
+        background.fill(COLORS["DARKBLUE"], (2 * SIZE, STATUS_HEIGHT, DELIM_WIDTH, SIZE + STATUS_HEIGHT2))
+        background.fill(COLORS["DARKBLUE"], (0, SIZE + STATUS_HEIGHT + STATUS_HEIGHT2, 2 * SIZE + DELIM_WIDTH, DELIM_WIDTH))
+        background.fill(COLORS["DARKBLUE"], (0, STATUS_HEIGHT, 2 * SIZE + DELIM_WIDTH, DELIM_WIDTH))
+        draw_text(background, font, "https://github.com/RandyWaterhouse/TSP_simulated_annealing", (SIZE // 2, SIZE + STATUS_HEIGHT + STATUS_HEIGHT2 + DELIM_WIDTH + 5), COLORS["DARKGREY"])
+        draw_text(background, font, "No of cities:", (110, 10), COLORS["BLACK"])
+        pygame.draw.line(background, COLORS["GREY1"], (380, 0), (380, STATUS_HEIGHT), 3)
+        draw_text(background, font, "Iterations:", (400, 10), COLORS["BLACK"])
+        pygame.draw.line(background, COLORS["GREY1"], (520, 0), (520, STATUS_HEIGHT), 3)
+        draw_text(background, font, "Tour Length Ratio:", (540, 10), COLORS["BLACK"])
+        pygame.draw.line(background, COLORS["GREY1"], (750, 0), (750, STATUS_HEIGHT), 3)
+        draw_text(background, font, "Speed (iters/sec):", (770, 10), COLORS["BLACK"])
+        pygame.draw.line(background, COLORS["GREY1"], (2 * SIZE + DELIM_WIDTH - 230, 0), (2 * SIZE + DELIM_WIDTH - 230, STATUS_HEIGHT), 3)
+        for button, x, y in buttons:
+            button.PlaceButton(background, x, y)
+        for x0 in (0, SIZE + DELIM_WIDTH):
+            draw_text(background, font, "Iterations:", (x0 + 30, STATUS_HEIGHT + 10), COLORS["BLACK"])
+            draw_text(background, font, "Min. Tour Length:", (x0 + 260, STATUS_HEIGHT + 10), COLORS["BLACK"])
+        return background
+
+    def SetCities(self, cities):
+        # pixel coordinates of the cities in both panels and layer with
+        # the cities; everything has to be drawn again for a new city set
+        if cities is self.cities:
+            return
+        self.cities = cities
+        self.points = [[(x0 + int(SIZE * x), STATUS_HEIGHT + STATUS_HEIGHT2 + int(SIZE * y)) for x, y in cities] for x0 in (0, SIZE + DELIM_WIDTH)]
+        self.layer = pygame.Surface((SIZE, SIZE))
+        self.layer.fill(COLORS["WHITE"])
+        self.layer.set_colorkey(COLORS["WHITE"])
+        for x, y in cities:
+            pygame.draw.circle(self.layer, COLORS["BLUE"], [int(SIZE * x), int(SIZE * y)], CITY_RADIUS)
+        self.shown = {}
+
+    def Draw(self, N, iters, speed, dengine, sengine):
+        # draw status bar and panels (direct sampling, simulated annealing)
+        # if their content has changed, update these parts of the display;
+        # returns number of parts drawn
+        surface, dirty = self.surface, []
+        font = get_font("Helvetica", 24)
+        status = (N, iters // 1000, round(dengine.best_energy / sengine.best_energy, 3), int(round(speed, 0)))
+        if status != self.shown.get("status"):
+            surface.blit(self.background, self.status_rect, self.status_rect)
+            draw_text(surface, font, str(status[0]), (250, 10), COLORS["BLUE"])
+            draw_text(surface, font, str(status[1]) + " k", (400, 40), COLORS["BLUE"])
+            draw_text(surface, font, str(status[2]), (540, 40), COLORS["BLUE"])
+            draw_text(surface, font, str(status[3]), (770, 40), COLORS["BLUE"])
+            self.shown["status"] = status
+            dirty.append(self.status_rect)
+        for k, engine in enumerate((dengine, sengine)):
+            panel = (engine.best_iter, engine.best_energy)
+            if panel != self.shown.get(k):
+                rect, points, x0 = self.panel_rects[k], self.points[k], k * (SIZE + DELIM_WIDTH)
+                surface.blit(self.background, rect, rect)
+                pygame.draw.lines(surface, COLORS["DARKGREY"], True, [points[c] for c in engine.best], 3)
+                surface.blit(self.layer, (x0, STATUS_HEIGHT + STATUS_HEIGHT2))
+                draw_text(surface, font, str(engine.best_iter), (x0 + 150, STATUS_HEIGHT + 10), COLORS["BLUE"])
+                draw_text(surface, font, str(round(engine.best_energy, 3)), (x0 + 460, STATUS_HEIGHT + 10), COLORS["BLUE"])
+                self.shown[k] = panel
+                dirty.append(rect)
+        if dirty:
+            pygame.display.update(dirty)
+        return len(dirty)
 
-########################################################################
-# simulation step for simulated annealing:
-#
-# The main part of the code for this function was provided by Werner Krauth
-# and his team from Ecole Normale Superieure as part of the course
-# "Statistical Mechanics - Algorithms and Computations" which was hosted
-# on the Coursera Platform (https://www.coursera.org/course/smac)
-# For an explanation of the simulated annealing method see
-# https://en.wikipedia.org/wiki/Simulated_annealing
-# Basically, in each iteration a "neighbouring" route is chosen and:
-# - if it has lower energy than the current route (i.e. is shorter): it is
-#   always accepted
-# - if it has higher energy than the current route (i.e. is longer): it is
-#   accepted with some probability p which depends on the difference in energies
-#   and a "temperature" which slowly decreases during the simulation. The
-#   parameter beta is basically the inverse temperature
-#
-def simulated_annealing(N, cities, beta, n_accept, best_energy):
-    energy = tour_length(cities, N)
-    new_route = False
-    if n_accept >= 100 * math.log(N):
-        beta *= 1.005
-        n_accept = 0
-    p = random.uniform(0.0, 1.0)
-    if p < 0.2:
-        # cut sequence somewhere in first half, swap first and second part,
-        # cut again at new point in first half and reverse first part
-        i = random.randint(0, N / 2)
-        cities = cities[i:] + cities[:i]
-        i = random.randint(0, N / 2)
-        a = cities[:i]
-        a.reverse()
-        new_cities = a + cities[i:]
-    elif p < 0.6:
-        # move randomly chosen city to a randomly chosen new position in sequence
-        new_cities = cities[:]
-        i = random.randint(1, N - 1)
-        a = new_cities.pop(i)
-        j = random.randint(1, N - 2)
-        new_cities.insert(j, a)
-    else:
-        # swap two randomly chosen cities
-        new_cities = cities[:]
-        i = random.randint(1, N - 1)
-        j = random.randint(1, N - 1)
-        new_cities[i] = cities[j]
-        new_cities[j] = cities[i]
-    new_energy = tour_length(new_cities, N)
-    if random.uniform(0.0, 1.0) < math.exp(- beta * (new_energy - energy)):
-        # accept new route with probability depending on difference in
-        # tour length (new - current) and parameter beta
-        n_accept += 1
-        energy = new_energy
-        cities = new_cities[:]
-        if energy < best_energy:
-           best_energy = energy
-           best_tour = cities[:]    
-           new_route = True
-    return cities, beta, n_accept, best_energy, new_route
-
-   
 ########################################################################
 # Main loop:
-def mainloop(surface, N, dcities, scities, start_timer):
-    # main loop, checks user actions, does simulation step, does graphics
-    # output if necessary
-    d_energy_min = float('inf')
-    s_energy_min = 10000
+def mainloop(surface, N, start_timer, state=None):
+    # main loop, once per frame: checks user actions, does simulation
+    # steps until the frame time is used up, does graphics output of what
+    # has changed; the engines keep the state of both simulations
+    # (tours, tour lengths, parameters for simulated annealing); state is
+    # a checkpoint to continue from; the simulation stops by itself when
+    # a stopping criterion is met (solver time counts for the time budget)
+    # and waits for user events without drawing then, as when paused
     running = True
-    iters, siters, diters = 0, 0, 0
-    start = timeit.default_timer()
+    stopped = None  # reason why a stopping criterion has paused the simulation
     speed = 0
-    # parameters for simulated annealing:
-    beta = 1.0        # inverse temperature
-    n_accept = 0
-    # ploting data:
-    plot_data = {"direct": {"iters": [], "lengths": []}, "simann": {"iters": [], "lengths": []}}
+    stats = STATS or TSP_stats.Stats()
+    stepped, busy, draw_time, solver_time = 0, 0.0, 0.0, 0.0
+    N, cities, dengine, sengine, iters, start, log = change_N(N if state is None else state["N"], state, INSTANCE)
+    criteria = make_criteria()
+    saved_at = timeit.default_timer()
 
     # define buttons for user control:
-    button_ncity_10 = Button(50, 30, "10", COLORS["LIGHTBLUE"], COLORS["BLACK"])
-    button_ncity_20 = Button(50, 30, "20", COLORS["LIGHTBLUE"], COLORS["BLACK"])
-    button_ncity_50 = Button(50, 30, "50", COLORS["LIGHTBLUE"], COLORS["BLACK"])
-    button_ncity_100 = Button(50, 30, "100", COLORS["LIGHTBLUE"], COLORS["BLACK"])
-    button_ncity_200 = Button(50, 30, "200", COLORS["LIGHTBLUE"], COLORS["BLACK"])
-    button_ncity_500 = Button(50, 30, "500", COLORS["LIGHTBLUE"], COLORS["BLACK"])
+    button_ncity_10 = Button(40, 30, "10", COLORS["LIGHTBLUE"], COLORS["BLACK"])
+    button_ncity_20 = Button(40, 30, "20", COLORS["LIGHTBLUE"], COLORS["BLACK"])
+    button_ncity_50 = Button(40, 30, "50", COLORS["LIGHTBLUE"], COLORS["BLACK"])
+    button_ncity_100 = Button(40, 30, "100", COLORS["LIGHTBLUE"], COLORS["BLACK"])
+    button_ncity_200 = Button(40, 30, "200", COLORS["LIGHTBLUE"], COLORS["BLACK"])
+    button_ncity_500 = Button(40, 30, "500", COLORS["LIGHTBLUE"], COLORS["BLACK"])
+    button_ncity_1000 = Button(40, 30, "1k", COLORS["LIGHTBLUE"], COLORS["BLACK"])
+    button_ncity_2000 = Button(40, 30, "2k", COLORS["LIGHTBLUE"], COLORS["BLACK"])
     button_quit = Button(60, 30, "Quit", COLORS["RED"], COLORS["BLACK"])
     button_pause = Button(60, 30, "Pause", COLORS["LIGHTBLUE"], COLORS["BLACK"])
     button_continue = Button(60, 30, "Cont.", COLORS["GREEN"], COLORS["BLACK"])
     button_save = Button(60, 30, "Save", COLORS["LAVENDER"], COLORS["BLACK"])
     button_plot = Button(60, 30, "Plot", COLORS["LAVENDER"], COLORS["BLACK"])
+    renderer = Renderer(surface, [(button_ncity_10, 10, 40), (button_ncity_20, 55, 40),
+                                  (button_ncity_50, 100, 40), (button_ncity_100, 145, 40),
+                                  (button_ncity_200, 190, 40), (button_ncity_500, 235, 40),
+                                  (button_ncity_1000, 280, 40), (button_ncity_2000, 325, 40),
+                                  (button_quit, 2 * SIZE + DELIM_WIDTH - 210, 10),
+                                  (button_pause, 2 * SIZE + DELIM_WIDTH - 210, 45),
+                                  (button_continue, 2 * SIZE + DELIM_WIDTH - 140, 45),
+                                  (button_save, 2 * SIZE + DELIM_WIDTH - 70, 10),
+                                  (button_plot, 2 * SIZE + DELIM_WIDTH - 70, 45)])
 
     # loop until user event:
     while True:
 
         # Event handler:
+        if not running:
+            # idle until the next event
+            pygame.event.post(pygame.event.wait())
+        t0 = timeit.default_timer()
+        new_N = None
         for event in pygame.event.get():
             # pygame event handler
-            if event.type == QUIT:
+            if event.type == pygame.QUIT:
                 # graphics window is closed
+                save_checkpoint(N, cities, dengine, sengine, iters)
                 pygame.quit()
                 return
-            elif event.type == KEYDOWN:
+            elif event.type == pygame.KEYDOWN:
                 # key is pressed
-                if event.key in [K_ESCAPE, K_q]:
+                if event.key in [pygame.K_ESCAPE, pygame.K_q]:
                     # 'q' or ESC will quit program
+                    save_checkpoint(N, cities, dengine, sengine, iters)
                     pygame.quit()
                     return
-                elif event.key == K_c:
+                elif event.key == pygame.K_c:
                     # 'c' continues simulation
-                    running = True
-                elif event.key == K_p:
+                    running, stopped = True, None
+                    criteria.Restart(sengine, solver_time)
+                    set_caption()
+                elif event.key == pygame.K_p:
                     # 'p' pauses simulation
                     running = False
-            elif event.type == MOUSEBUTTONDOWN:
+            elif event.type == pygame.MOUSEBUTTONDOWN:
                 # mouse button is pressed
                 if button_ncity_10.IsPressed(pygame.mouse.get_pos()):
                     # N = 10 selected
-                    N, dcities, scities, iters, siters, diters, d_energy_min, s_energy_min, beta, n_accept, start, plot_data = change_N(10)
+                    new_N = 10
                 elif button_ncity_20.IsPressed(pygame.mouse.get_pos()):
                     # N = 20 selected
-                    N, dcities, scities, iters, siters, diters, d_energy_min, s_energy_min, beta, n_accept, start, plot_data = change_N(20)
+                    new_N = 20
                 elif button_ncity_50.IsPressed(pygame.mouse.get_pos()):
                     # N = 50 selected
-                    N, dcities, scities, iters, siters, diters, d_energy_min, s_energy_min, beta, n_accept, start, plot_data = change_N(50)
+                    new_N = 50
                 elif button_ncity_100.IsPressed(pygame.mouse.get_pos()):
                     # N = 100 selected
-                    N, dcities, scities, iters, siters, diters, d_energy_min, s_energy_min, beta, n_accept, start, plot_data = change_N(100)
+                    new_N = 100
                 elif button_ncity_200.IsPressed(pygame.mouse.get_pos()):
                     # N = 200 selected
-                    N, dcities, scities, iters, siters, diters, d_energy_min, s_energy_min, beta, n_accept, start, plot_data = change_N(200)
+                    new_N = 200
                 elif button_ncity_500.IsPressed(pygame.mouse.get_pos()):
                     # N = 500 selected
-                    N, dcities, scities, iters, siters, diters, d_energy_min, s_energy_min, beta, n_accept, start, plot_data = change_N(500)
+                    new_N = 500
+                elif button_ncity_1000.IsPressed(pygame.mouse.get_pos()):
+                    # N = 1000 selected
+                    new_N = 1000
+                elif button_ncity_2000.IsPressed(pygame.mouse.get_pos()):
+                    # N = 2000 selected
+                    new_N = 2000
                 elif button_quit.IsPressed(pygame.mouse.get_pos()):
                     # 'Quit' selected
                     if VERBOSE: print "Quitting..."
+                    save_checkpoint(N, cities, dengine, sengine, iters)
                     pygame.quit()
                     return
                 elif button_continue.IsPressed(pygame.mouse.get_pos()):
                     # 'Continue' selected, simulation continues
                     if VERBOSE: print "Continuing..."
-                    running = True
+                    running, stopped = True, None
+                    criteria.Restart(sengine, solver_time)
+                    set_caption()
                 elif button_pause.IsPressed(pygame.mouse.get_pos()):
                     # 'Pause' selected, simulation is halted
                     if VERBOSE: print "Simulation paused."
@@ -348,135 +428,159 @@ def mainloop(surface, N, dcities, scities, start_timer):
                     if VERBOSE: print "Image saved, filename:", filename
                 elif button_plot.IsPressed(pygame.mouse.get_pos()):
                     # 'Plot' selected, generate plot of tour length vs iteration
-                    filename = make_plot(plot_data, N, iters)
+                    filename = make_plot(log, N, iters)
                     if VERBOSE: print "Plot generated, filename:", filename
+        if new_N is not None:
+            # new cities, a simulation paused by a stopping criterion starts
+            # again (one paused by the user stays paused)
+            N, cities, dengine, sengine, iters, start, log = change_N(new_N)
+            criteria = make_criteria()
+            if stopped:
+                running, stopped = True, None
+                set_caption()
                                                 
-        if not running:
-            # if simulation is paused, skip rest of mainloop
-            continue
-        if VERBOSE and iters % 10000 == 0:
-            print "N/iters/beta/s_energy_min =", N, iters, beta, round(s_energy_min, 3)
-        iters += 1  # iteration counter
-        
-        change = False
-        # generate new route by direct sampling:
-        new_dcities = direct_sampling(dcities[:])
-        d_energy = tour_length(new_dcities, N)
-        if d_energy < d_energy_min:
-            d_energy_min = d_energy
-            if VERBOSE:
-                print "Tour length direct sampling:", d_energy_min, "at iteration", iters
-            dcities = new_dcities[:]
-            diters = iters
-            change = True
-            plot_data["direct"]["iters"].append(iters)
-            plot_data["direct"]["lengths"].append(d_energy_min)
-        # generate new route by simulated annealing:
-        new_scities, beta, n_accept, s_energy_min, new_route = simulated_annealing(N, scities[:], beta, n_accept, s_energy_min)
-        if new_route:
-            if VERBOSE:
-                print "Tour length simulated annealing:", s_energy_min, "at iteration", iters
-            scities = new_scities[:]
-            siters = iters
-            change = True
-            plot_data["simann"]["iters"].append(iters)
-            plot_data["simann"]["lengths"].append(s_energy_min)
-
-
-        if iters % 1000 == 0:
-            # every 1k iterations we will plot current configuration even if
-            # it hasn't changed
-            change = True
-            
-        if change:
-
-            # calculate simulation speed:
-            delta_iter = 100000 // N
-            show_speed = iters % delta_iter == 0
-            if show_speed:
-                T = timeit.default_timer() - start
-                start = timeit.default_timer()
-                speed = delta_iter / T
-            # only generate graphics output if new route is present for
-            # direct sampling and/or simulated annealing or if iteration
-            # count is divisible by 1000
-            #
-            # buttons and text elements:
-            surface.fill(COLORS["WHITE"])
-            surface.fill(COLORS["LIGHTYELLOW"], (0, 0, 2 * SIZE + DELIM_WIDTH, STATUS_HEIGHT))
-            surface.fill(COLORS["DARKBLUE"], (SIZE, STATUS_HEIGHT, DELIM_WIDTH, SIZE + STATUS_HEIGHT2))
-            surface.fill(COLORS["DARKBLUE"], (0, STATUS_HEIGHT, DELIM_WIDTH, SIZE + STATUS_HEIGHT2))
-            surface.fill(COLORS["DARKBLUE"], (2 * SIZE, STATUS_HEIGHT, DELIM_WIDTH, SIZE + STATUS_HEIGHT2))
-            surface.fill(COLORS["DARKBLUE"], (0, SIZE + STATUS_HEIGHT + STATUS_HEIGHT2, 2 * SIZE + DELIM_WIDTH, DELIM_WIDTH))
-            surface.fill(COLORS["DARKBLUE"], (0, STATUS_HEIGHT, 2 * SIZE + DELIM_WIDTH, DELIM_WIDTH))
-            draw_text(surface, helv24, "https://github.com/RandyWaterhouse/TSP_simulated_annealing", (SIZE // 2, SIZE + STATUS_HEIGHT + STATUS_HEIGHT2 + DELIM_WIDTH + 5), COLORS["DARKGREY"])
-            draw_text(surface, helv24, "No of cities:", (110, 10), COLORS["BLACK"])
-            draw_text(surface, helv24, str(N), (250, 10), COLORS["BLUE"])
-            button_ncity_10.PlaceButton(surface, 10, 40)
-            button_ncity_20.PlaceButton(surface, 70, 40)
-            button_ncity_50.PlaceButton(surface, 130, 40)
-            button_ncity_100.PlaceButton(surface, 190, 40)
-            button_ncity_200.PlaceButton(surface, 250, 40)
-            button_ncity_500.PlaceButton(surface, 310, 40)
-            pygame.draw.line(surface, COLORS["GREY1"], (380, 0), (380, STATUS_HEIGHT), 3)
-            draw_text(surface, helv24, "Iterations:", (400, 10), COLORS["BLACK"])
-            draw_text(surface, helv24, str(iters // 1000) + " k", (400, 40), COLORS["BLUE"])
-            pygame.draw.line(surface, COLORS["GREY1"], (520, 0), (520, STATUS_HEIGHT), 3)
-            draw_text(surface, helv24, "Tour Length Ratio:", (540, 10), COLORS["BLACK"])
-            draw_text(surface, helv24, str(round(d_energy_min / s_energy_min, 3)), (540, 40), COLORS["BLUE"])
-            pygame.draw.line(surface, COLORS["GREY1"], (750, 0), (750, STATUS_HEIGHT), 3)
-            draw_text(surface, helv24, "Speed (iters/sec):", (770, 10), COLORS["BLACK"])
-            draw_text(surface, helv24, str(int(round(speed, 0))), (770, 40), COLORS["BLUE"])
-            pygame.draw.line(surface, COLORS["GREY1"], (2 * SIZE + DELIM_WIDTH - 230, 0), (2 * SIZE + DELIM_WIDTH - 230, STATUS_HEIGHT), 3)
-            button_quit.PlaceButton(surface, 2 * SIZE + DELIM_WIDTH - 210, 10)
-            button_pause.PlaceButton(surface, 2 * SIZE + DELIM_WIDTH - 210, 45)
-            button_continue.PlaceButton(surface, 2 * SIZE + DELIM_WIDTH - 140, 45)
-            button_save.PlaceButton(surface, 2 * SIZE + DELIM_WIDTH - 70, 10)
-            button_plot.PlaceButton(surface, 2 * SIZE + DELIM_WIDTH - 70, 45)
-
-            # draw cities and roads:
-            #
-            # direct sampling:
-            for i in range(N):
-                x1, y1 = dcities[i]
-                x2, y2 = dcities[(i+1)%N]
-                xi1 = int(SIZE * x1)
-                xi2 = int(SIZE * x2)
-                yi1 = STATUS_HEIGHT + STATUS_HEIGHT2+ int(SIZE * y1)
-                yi2 = STATUS_HEIGHT + STATUS_HEIGHT2 + int(SIZE * y2)
-                pygame.draw.line(surface, COLORS["DARKGREY"], [xi1, yi1], [xi2, yi2], 3)
-            for x, y in dcities:
-                xi = int(SIZE * x)
-                yi = STATUS_HEIGHT + STATUS_HEIGHT2 + int(SIZE * y)
-                pygame.draw.circle(surface, COLORS["BLUE"], [xi, yi], CITY_RADIUS)
-            draw_text(surface, helv24, "Iterations:", (30, STATUS_HEIGHT + 10), COLORS["BLACK"])
-            draw_text(surface, helv24, str(diters), (150, STATUS_HEIGHT + 10), COLORS["BLUE"])
-            draw_text(surface, helv24, "Min. Tour Length:", (260, STATUS_HEIGHT + 10), COLORS["BLACK"])
-            draw_text(surface, helv24, str(round(d_energy_min, 3)), (460, STATUS_HEIGHT + 10), COLORS["BLUE"])
-            # simulated annealing:
-            for i in range(N):
-                x1, y1 = scities[i]
-                x2, y2 = scities[(i+1)%N]
-                xi1 = SIZE + DELIM_WIDTH + int(SIZE * x1)
-                xi2 = SIZE + DELIM_WIDTH + int(SIZE * x2)
-                yi1 = STATUS_HEIGHT + STATUS_HEIGHT2 + int(SIZE * y1)
-                yi2 = STATUS_HEIGHT + STATUS_HEIGHT2 + int(SIZE * y2)
-                pygame.draw.line(surface, COLORS["DARKGREY"], [xi1, yi1], [xi2, yi2], 3)
-            for x, y in dcities:
-                xi = SIZE + DELIM_WIDTH + int(SIZE * x)
-                yi = STATUS_HEIGHT + STATUS_HEIGHT2 + int(SIZE * y)
-                pygame.draw.circle(surface, COLORS["BLUE"], [xi, yi], CITY_RADIUS)
-            draw_text(surface, helv24, "Iterations:", (SIZE + DELIM_WIDTH + 30, STATUS_HEIGHT + 10), COLORS["BLACK"])
-            draw_text(surface, helv24, str(siters), (SIZE + DELIM_WIDTH + 150, STATUS_HEIGHT + 10), COLORS["BLUE"])
-            draw_text(surface, helv24, "Min. Tour Length:", (SIZE + DELIM_WIDTH + 260, STATUS_HEIGHT + 10), COLORS["BLACK"])
-            draw_text(surface, helv24, str(round(s_energy_min, 3)), (SIZE + DELIM_WIDTH + 460, STATUS_HEIGHT + 10), COLORS["BLUE"])
-
-            # update graphics output:
-            pygame.display.flip()
-            # wait a moment (SLEEP may be zero):
-            time.sleep(SLEEP)
+        stats.Add("events", timeit.default_timer() - t0)
+        if running:
+            # run both solvers in batches of STEPS iterations for the part
+            # of the frame not needed for drawing (time of last drawing)
+            t0 = timeit.default_timer()
+            deadline = t0 + max(1.0 / FPS - draw_time, 0.0)
+            t = t0
+            while True:
+                # generate new routes by direct sampling and simulated annealing:
+                if dengine.Run(STEPS):
+                    if VERBOSE:
+                        print "Tour length direct sampling:", dengine.best_energy, "at iteration", dengine.best_iter
+                    log.Add("direct", dengine.best_iter, dengine.best_energy)
+                t, t_direct = timeit.default_timer(), t
+                stats.Add("direct", t - t_direct)
+                if sengine.Run(STEPS):
+                    if VERBOSE:
+                        print "Tour length simulated annealing:", sengine.best_energy, "at iteration", sengine.best_iter
+                    log.Add("simann", sengine.best_iter, sengine.best_energy)
+                t, t_simann = timeit.default_timer(), t
+                stats.Add("simann", t - t_simann)
+                iters += STEPS  # iteration counter
+                stepped += STEPS
+                if VERBOSE and iters % 10000 < STEPS:
+                    print "N/iters/beta/s_energy_min =", N, iters, sengine.beta, round(sengine.best_energy, 3)
+                reason = criteria.Check(sengine, solver_time + t - t0)
+                if reason or t >= deadline:
+                    break
+            t1 = t
+            busy += t1 - t0
+            solver_time += t1 - t0
+            if reason:
+                if VERBOSE: print "Simulation stopped:", reason, "at iteration", iters
+                running, stopped = False, reason
+                set_caption(reason)
+                if POLISH and sengine.Polish():
+                    log.Add("simann", sengine.best_iter, sengine.best_energy)
+            # simulation speed, iterations per second of solver time:
+            if t1 - start >= SPEED_TIME:
+                speed = stepped / busy
+                start, stepped, busy = t1, 0, 0.0
+            if t1 - saved_at >= TSP_engine.CHECKPOINT_TIME:
+                save_checkpoint(N, cities, dengine, sengine, iters)
+                saved_at = timeit.default_timer()
+
+        # draw changed parts of the window, at most FPS frames per second:
+        t0 = timeit.default_timer()
+        renderer.SetCities(cities)
+        if renderer.Draw(N, iters, speed, dengine, sengine):
+            stats.Count("redraws")
+        draw_time = timeit.default_timer() - t0
+        stats.Add("draw", draw_time)
+        stats.Tick({"direct": dengine, "simann": sengine}, N=N, iters=iters, beta=sengine.beta, speed=speed)
+        # wait a moment (SLEEP may be zero):
+        time.sleep(SLEEP)
+        fpsClock.tick(FPS)
         
 
-# calling "mainloop" will start simulation:
-mainloop(surface, N, dcities, scities, start_timer)
+########################################################################
+# Command line:
+def run(args, stats=None):
+    # run headless or interactive simulation as given by the command line
+    # arguments, stats (TSP_stats.Stats, optional) collects statistics
+    global SEED, BLOCK, STATS, CHECKPOINT, SCHEDULE, INSTANCE, POLISH_EVERY, POLISH, ITERS, TIME_BUDGET, STOP
+    instance = TSP_instance.load(args.instance) if args.instance else None
+    if args.headless:
+        if instance is not None:
+            print "Instance", TSP_instance.describe(instance)
+        log = TSP_record.Recorder(args.log) if args.log else None
+        if args.chains:
+            import TSP_parallel
+            results = TSP_parallel.run_parallel(args.N, args.iters, args.time, args.seed, args.chains, args.mode, stats=stats, instance=instance,
+                                                polish=not args.no_polish, start=args.start, polish_every=args.polish_every, stop=not args.no_stop,
+                                                log=log, checkpoint=args.checkpoint, resume=args.resume, schedule=args.schedule)
+        else:
+            results = TSP_engine.run_headless(args.N, args.iters, args.time, args.seed, args.engines.split(","), args.block, args.start,
+                                              stats=stats, log=log, checkpoint=args.checkpoint, resume=args.resume, schedule=args.schedule,
+                                              instance=instance, polish=not args.no_polish, polish_every=args.polish_every, stop=not args.no_stop)
+        if log is not None:
+            log.Close()
+        TSP_engine.print_results(results)
+        if args.output:
+            TSP_engine.save_results(results, args.output)
+        return
+    SEED, BLOCK, STATS, CHECKPOINT, SCHEDULE, INSTANCE = args.seed, args.block, stats, args.checkpoint, args.schedule, instance
+    POLISH_EVERY, POLISH = args.polish_every, not args.no_polish
+    ITERS, TIME_BUDGET, STOP = args.iters, args.time, not args.no_stop
+    state = None
+    if args.resume and os.path.exists(args.checkpoint):
+        state = TSP_engine.load_checkpoint(args.checkpoint)
+        assert "direct" in state, "WTF?? not a checkpoint of the GUI: " + args.checkpoint
+        SEED = state["seed"]
+    start_timer = timeit.default_timer()
+    # calling "mainloop" will start simulation:
+    mainloop(init_display(), args.N, start_timer, state)
+
+def main():
+    # without arguments the interactive simulation is started, with
+    # --headless the solvers run for a fixed number of iterations and/or
+    # a time budget and the results are printed (and saved with --output);
+    # statistics and profile are written with --stats/--profile or the
+    # environment variables TSP_STATS/TSP_PROFILE
+    parser = argparse.ArgumentParser(description="TSP: direct sampling vs simulated annealing")
+    parser.add_argument("--headless", action="store_true", help="run solvers without graphics")
+    parser.add_argument("-N", type=int, default=N, help="number of cities (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=SEED, help="random seed for cities and solvers")
+    parser.add_argument("--instance", help="solve the cities of a TSPLIB .tsp file or raw coordinates (%s, x y pairs as float64) instead of -N random ones" % TSP_instance.RAW_EXTENSION)
+    parser.add_argument("--iters", type=int, help="number of iterations per solver (GUI: until the simulation stops)")
+    parser.add_argument("--time", type=float, help="time budget in seconds per solver (GUI: until the simulation stops)")
+    parser.add_argument("--no-stop", action="store_true", help="don't stop simulated annealing when it has converged (no improvement for a while or frozen), only at the budget")
+    parser.add_argument("--engines", default="direct,simann", help="comma separated solvers to run (headless), default: %(default)s")
+    parser.add_argument("--block", type=int, default=BLOCK, help="block size for direct sampling, 1: one tour at a time (default: %(default)s)")
+    parser.add_argument("--start", default="random", choices=("random", "curve"), help="initial tour for simulated annealing (headless): random or along a space-filling curve, default: %(default)s")
+    parser.add_argument("--schedule", choices=sorted(TSP_cooling.SCHEDULES), help="cooling schedule for simulated annealing, see TSP_cooling.py (default depends on number of cities)")
+    parser.add_argument("--polish-every", type=int, default=POLISH_EVERY, help="polish the best tour of simulated annealing by 2-opt/Or-opt local search every this many iterations, 0: never (default: %(default)s)")
+    parser.add_argument("--no-polish", action="store_true", help="don't polish the best tour of simulated annealing when done")
+    parser.add_argument("--chains", type=int, help="run this many annealing chains in parallel processes instead (headless)")
+    parser.add_argument("--mode", default="tempering", choices=("tempering", "restarts"), help="parallel tempering or independent chains restarting from the best tour (with --chains), default: %(default)s")
+    parser.add_argument("--output", help="save results as JSON file (headless)")
+    parser.add_argument("--log", help="write shortest tour length vs iteration as CSV file (headless), plot it with TSP_record.py")
+    parser.add_argument("--checkpoint", help="save the simulation state to this file every %d seconds (and when the GUI is closed)" % TSP_engine.CHECKPOINT_TIME)
+    parser.add_argument("--resume", action="store_true", help="continue from the --checkpoint file, if it exists")
+    parser.add_argument("--stats", default=os.environ.get("TSP_STATS"), help="append time per phase and move statistics as JSON lines to this file")
+    parser.add_argument("--stats-interval", type=float, default=TSP_stats.INTERVAL, help="seconds between two lines of statistics (default: %(default)s)")
+    parser.add_argument("--profile", default=os.environ.get("TSP_PROFILE"), help="run under cProfile and save the profile to this file")
+    args = parser.parse_args()
+    if args.headless and not (args.iters or args.time):
+        parser.error("--headless needs --iters and/or --time")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+    if args.schedule and args.chains and args.mode == "tempering":
+        parser.error("--schedule doesn't apply to parallel tempering, its chains run at fixed temperatures")
+    stats = TSP_stats.Stats(args.stats, args.stats_interval) if args.stats else None
+    try:
+        if args.profile:
+            TSP_stats.profile(args.profile, run, args, stats)
+        else:
+            run(args, stats)
+    finally:
+        if stats is not None:
+            stats.Close()
+
+if __name__ == "__main__":
+    main()
 
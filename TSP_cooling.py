@@ -0,0 +1,209 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), cooling schedules for simulated
+# annealing; a schedule sets the inverse temperature beta of an engine
+# (SimulatedAnnealing in TSP_engine.py):
+#
+# - "classic": beta *= 1.005 after every 100 * log(N) accepted moves,
+#   uphill moves are only counted and dropped (the original schedule)
+# - "geometric": beta *= alpha per iteration
+# - "acceptance": beta is adjusted so the rate of accepted moves follows
+#   a target rate, which decreases geometrically
+# - "reheat": geometric cooling, beta is lowered again if the shortest
+#   tour hasn't improved for a while
+#
+# All but "classic" run a plain Metropolis chain (keep_uphill) and start
+# from a temperature calibrated from the tour length changes of sampled
+# moves. The engine calls Update() when the number of accepted moves
+# since the last update reaches limit or the iteration number reaches
+# next, so between updates a schedule costs one comparison per step.
+#
+########################################################################
+#
+# Import packages:
+import math
+import random
+
+########################################################################
+# Global settings:
+INTERVAL = 1000      # iterations between updates of schedules working per iteration
+SAMPLES = 1000       # number of sampled moves for calibration of initial temperature
+ACCEPT0 = 0.5        # acceptance probability of an average uphill move at the initial temperature
+SCALE = 30.0         # cooling length of schedules in units of N log N iterations, see default_params()
+# schedule and cooling length (in units of N log N) per number of cities
+# (up to N), chosen from runs on 3 - 6 instances for N = 10 ... 2000
+# (shortest tour after 3, 10, 30, ... 1000 N log N iterations): the
+# classic schedule is ahead in short runs, up to about 10 N log N
+# iterations (30 for N = 200), in longer ones a real annealing schedule
+# ends up 3-9% shorter for 20 - 200 cities and about 1% shorter from 1000
+# cities on; in between, with random moves over the whole tour, the
+# classic schedule is as good or better at every length of the run
+DEFAULTS = [(20, "acceptance", 100.0),
+            (200, "geometric", 10.0),
+            (999, "classic", SCALE),
+            (float("inf"), "geometric", 10.0)]
+
+
+########################################################################
+# Helper functions:
+def uphill_deltas(engine, samples=SAMPLES):
+    # tour length increases of the uphill ones among samples moves of the
+    # engine at its current tour (random 2-opt moves, between near
+    # neighbours if the engine uses candidate lists); the moves are
+    # sampled with a generator of its own, so the engine's random numbers
+    # stay the same
+    N, tour, dist, knn = engine.N, engine.tour, engine.dist, engine.knn
+    rng = random.Random(N)
+    uphill = []
+    for k in xrange(samples):
+        i = rng.randrange(N)
+        if knn is None:
+            j = rng.randrange(N)
+        else:
+            j = engine.pos[knn[tour[i]][rng.randrange(len(knn[tour[i]]))]]
+        a, b, c, d = tour[i], tour[(i + 1) % N], tour[j], tour[(j + 1) % N]
+        delta = dist(a, c) + dist(b, d) - dist(a, b) - dist(c, d)
+        if delta > 1e-12:
+            # not just a rounding error of a move which keeps the tour
+            uphill.append(delta)
+    return uphill
+
+def calibrate_beta(engine, accept=ACCEPT0, samples=SAMPLES):
+    # inverse temperature at which an average uphill move of the engine is
+    # accepted with probability accept
+    uphill = uphill_deltas(engine, samples)
+    if not uphill:
+        return engine.beta
+    return - math.log(accept) / (sum(uphill) / len(uphill))
+
+def acceptance(engine, samples=SAMPLES):
+    # fraction of uphill moves the engine accepts at its current
+    # temperature (1.0 if there are no uphill moves), mostly the small ones
+    uphill = uphill_deltas(engine, samples)
+    if not uphill:
+        return 1.0
+    return sum(math.exp(- engine.beta * delta) for delta in uphill) / len(uphill)
+
+
+########################################################################
+# Schedules:
+class Schedule():
+    # base class, constant temperature; beta0 is the initial inverse
+    # temperature, None keeps the one of the engine, "auto" calibrates it
+    keep_uphill = True
+
+    def __init__(self, beta0="auto"):
+        self.beta0 = beta0
+        self.limit = float("inf")   # update after this many accepted moves
+        self.next = float("inf")    # update at this iteration number
+
+    def Start(self, engine):
+        # called by the engine when it is created, returns initial beta
+        if self.beta0 == "auto":
+            return calibrate_beta(engine)
+        return engine.beta if self.beta0 is None else self.beta0
+
+    def Update(self, beta, n_accept, iters, engine):
+        # returns new beta and count of accepted moves (n_accept is the
+        # count since the last reset, iters the number of iterations done)
+        return beta, 0
+
+
+class ClassicSchedule(Schedule):
+    # with keep_uphill=False the tour never gets longer, beta only sets the
+    # pace of the cooling
+    keep_uphill = False
+
+    def __init__(self, cooling=1.005, beta0=None):
+        Schedule.__init__(self, beta0)
+        self.cooling = cooling
+
+    def Start(self, engine):
+        self.limit = 100 * math.log(engine.N)
+        return Schedule.Start(self, engine)
+
+    def Update(self, beta, n_accept, iters, engine):
+        return beta * self.cooling, 0
+
+
+class GeometricSchedule(Schedule):
+
+    def __init__(self, alpha, interval=INTERVAL, beta0="auto"):
+        Schedule.__init__(self, beta0)
+        self.alpha = alpha
+        self.interval = interval
+
+    def Start(self, engine):
+        self.next = engine.iters + self.interval
+        return Schedule.Start(self, engine)
+
+    def Update(self, beta, n_accept, iters, engine):
+        self.next = iters + self.interval
+        return beta * self.alpha ** self.interval, 0
+
+
+class AcceptanceSchedule(Schedule):
+    # the target rate of accepted moves (per iteration) starts at rate and
+    # decreases by decay per iteration down to floor; beta is raised if
+    # more moves are accepted than the target, lowered otherwise
+
+    def __init__(self, rate=0.5, decay=0.99999, floor=0.001, gain=0.5, interval=INTERVAL, beta0="auto"):
+        Schedule.__init__(self, beta0)
+        self.rate, self.decay, self.floor, self.gain = rate, decay, floor, gain
+        self.interval = interval
+
+    def Start(self, engine):
+        self.next = engine.iters + self.interval
+        return Schedule.Start(self, engine)
+
+    def Update(self, beta, n_accept, iters, engine):
+        rate = n_accept / float(self.interval)
+        beta *= math.exp(max(-1.0, min(1.0, self.gain * (rate - self.rate) / self.rate)))
+        self.rate = max(self.rate * self.decay ** self.interval, self.floor)
+        self.next = iters + self.interval
+        return beta, 0
+
+
+class ReheatSchedule(GeometricSchedule):
+    # geometric cooling; if the shortest tour hasn't improved for
+    # stagnation iterations, beta is multiplied by reheat (< 1)
+
+    def __init__(self, alpha, stagnation, reheat=0.5, interval=INTERVAL, beta0="auto"):
+        GeometricSchedule.__init__(self, alpha, interval, beta0)
+        self.stagnation = stagnation
+        self.reheat = reheat
+        self.reheated = 0   # iteration number of last reheating
+
+    def Update(self, beta, n_accept, iters, engine):
+        beta, n_accept = GeometricSchedule.Update(self, beta, n_accept, iters, engine)
+        if iters - max(engine.best_iter, self.reheated) >= self.stagnation:
+            beta *= self.reheat
+            self.reheated = iters
+        return beta, n_accept
+
+
+SCHEDULES = {"classic": ClassicSchedule, "geometric": GeometricSchedule,
+             "acceptance": AcceptanceSchedule, "reheat": ReheatSchedule}
+
+def make_schedule(name, N):
+    # schedule by name (see SCHEDULES) with the parameters for N cities,
+    # None: default schedule for N cities (see DEFAULTS)
+    for n, default, scale in DEFAULTS:
+        if N <= n:
+            break
+    if name is None:
+        name = default
+    return SCHEDULES[name](**default_params(name, N, scale if name == default else SCALE))
+
+def default_params(name, N, scale=SCALE):
+    # parameters of a schedule for N cities: moves needed for annealing
+    # grow like N log N, the schedules cool by a factor of e^5 (or lower
+    # the target acceptance rate to 1/500) in scale * N log N iterations
+    length = scale * N * math.log(N + 1)
+    if name == "geometric":
+        return {"alpha": math.exp(5.0 / length)}
+    elif name == "acceptance":
+        return {"decay": math.exp(math.log(0.002) / length)}
+    elif name == "reheat":
+        return {"alpha": math.exp(5.0 / length), "stagnation": int(length // 5)}
+    return {}
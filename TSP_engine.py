@@ -0,0 +1,912 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), solver engines: direct sampling and
+# simulated annealing, without any graphics, can be used from the GUI
+# (TSP_comparism_v10.py), from the command line in headless mode or as
+# Python module:
+#
+#   import TSP_engine
+#   results = TSP_engine.run_headless(200, iters=10**6, seed=1)
+#
+########################################################################
+#
+# Import packages:
+import random
+import math
+import os
+import json
+import timeit
+import cPickle as pickle
+import ctypes
+from collections import deque
+from array import array
+import numpy as np
+import TSP_spatial
+import TSP_cooling
+import TSP_instance
+import TSP_stopping
+
+########################################################################
+# Global settings:
+DENSE_MAX_N = 1000   # up to this number of cities all distances are precomputed in a dense matrix
+ROW_CACHE = 256      # number of distance rows kept in memory by DistanceRows
+NEIGHBOUR_N = 1000   # from this number of cities on simulated annealing proposes 2-opt/Or-opt moves between near neighbours
+SHORT_PATH = 32      # paths up to this length are reversed element by element, longer ones with numpy
+CHECK_ENERGY = 0     # every CHECK_ENERGY iterations compare incremental tour length of simulated annealing against full recalculation (0: never)
+BLOCK = 4096         # number of random tours generated and scored at once by direct sampling (1: one at a time)
+BLOCK_ELEMENTS = 2**21  # upper limit for block size * number of cities (memory used by a block)
+PROPOSALS = 4096     # number of random moves generated at once by simulated annealing
+CHUNK = 1000         # number of iterations between checks of time budget in headless mode
+CHECKPOINT_TIME = 60.0  # interval (in seconds) between two checkpoints
+POLISH = True        # polish the best tour of simulated annealing by local search when a headless run is done
+POLISH_EVERY = 0     # iterations between two polishings of the best tour during simulated annealing (0: never)
+POLISH_GAIN = 1e-12  # minimal decrease of the tour length by a local search move (no cycling on rounding errors)
+STREAMS = {"cities": 0, "direct": 1, "simann": 2}  # random number stream (see sub_seed()) per use of a seed, parallel chains take the ones after these
+ENGINES = {"direct": "direct sampling", "simann": "simulated annealing",
+           "tempering": "parallel tempering", "restarts": "parallel annealing with restarts"}
+
+
+########################################################################
+# Helper functions:
+def tour_length(tour, N, dist):
+    # get total tour length for current sequence of city indices
+    assert len(tour) == N, "WTF?? " + str(len(tour)) + " vs " + str(N)
+    return sum(dist(tour[k + 1], tour[k]) for k in range(N - 1)) + dist(tour[0], tour[N - 1])
+
+def sub_seed(seed, k):
+    # derive seed for k-th of several random number generators
+    return None if seed is None else seed * 1000003 + k
+
+def numpy_seed(seed):
+    # seed for a numpy RandomState, which takes 32 bit seeds only
+    return None if seed is None else seed % 2**32
+
+def generate_cities(N, seed=None):
+    # generate positions for N cities randomly in range .025 <= x <= .975
+    # and .025 <= y <= .975 (leave margins at all sides for aesthetics
+    # reasons)
+    rng = random.Random(sub_seed(seed, STREAMS["cities"]))
+    cities = [(.025 + rng.uniform(0.0, 0.95), .025 + rng.uniform(0.0, 0.95)) for i in range(N)]
+    return np.array(cities)
+
+# Distance backends, both are called as dist(i, j) with city indices i, j:
+class DistanceMatrix():
+    # all distances precomputed, for small numbers of cities
+
+    def __init__(self, cities):
+        x, y = cities[:, 0], cities[:, 1]
+        self.matrix = np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+        # nested lists are faster than numpy for single element lookups:
+        self.rows = self.matrix.tolist()
+
+    def __call__(self, i, j):
+        return self.rows[i][j]
+
+
+class DistanceRows():
+    # rows of the distance matrix are computed when needed, the cache_size
+    # least recently used rows are kept in memory, for large numbers of cities
+
+    def __init__(self, cities, cache_size):
+        self.x = cities[:, 0]
+        self.y = cities[:, 1]
+        self.cache_size = cache_size
+        self.rows = {}
+        self.used = {}
+        self.clock = 0
+
+    def Row(self, i):
+        self.clock += 1
+        row = self.rows.get(i)
+        if row is None:
+            if len(self.rows) >= self.cache_size:
+                # evict least recently used row:
+                k = min(self.used, key=self.used.get)
+                del self.rows[k], self.used[k]
+            row = np.hypot(self.x - self.x[i], self.y - self.y[i]).tolist()
+            self.rows[i] = row
+        self.used[i] = self.clock
+        return row
+
+    def __call__(self, i, j):
+        # a cached row of either city will do
+        if j in self.rows and i not in self.rows:
+            i, j = j, i
+        return self.Row(i)[j]
+
+
+class DistancePoints():
+    # nothing precomputed, memory O(N), for very large numbers of cities;
+    # the coordinates (x, y of city i at 2 i, 2 i + 1) are read through a
+    # ctypes array on the memory of cities, so the memory-mapped cities of
+    # an instance file are shared by all processes (see TSP_instance.py)
+    # instead of being copied in each one
+
+    def __init__(self, cities):
+        if not (cities.dtype == np.float64 and cities.flags.c_contiguous and cities.flags.writeable):
+            cities = np.array(cities, dtype=np.float64)
+        self.xy = (ctypes.c_double * cities.size).from_buffer(cities)
+
+    def __call__(self, i, j):
+        xy = self.xy
+        i, j = i + i, j + j
+        dx = xy[i] - xy[j]
+        dy = xy[i + 1] - xy[j + 1]
+        return math.sqrt(dx * dx + dy * dy)
+
+def make_distances(cities, backend=None):
+    # build distance backend for a set of cities, distances are looked up
+    # by city index: dist(i, j); backend "matrix", "rows" or "points", by
+    # default a dense matrix up to DENSE_MAX_N cities and no precomputation
+    # for more (the row cache only pays off if lookups are concentrated on
+    # few cities, random moves miss it almost always)
+    if backend is None:
+        backend = "matrix" if len(cities) <= DENSE_MAX_N else "points"
+    if backend == "matrix":
+        return DistanceMatrix(cities)
+    elif backend == "rows":
+        return DistanceRows(cities, ROW_CACHE)
+    return DistancePoints(cities)
+
+
+########################################################################
+# simulation step for direct sampling, just randomly shuffle cities,
+# i.e. previous configuration has to impact whatsoever on next configuration:
+def direct_sampling(cities, rng=random):
+    rng.shuffle(cities)
+    return cities
+
+# same for a whole block of random tours at once: returns array of shape
+# (size, N) with one random permutation of city indices per row and the
+# lengths of these tours, computed with numpy from the city positions;
+# rng is a numpy RandomState
+def direct_sampling_block(cities, size, rng):
+    N = len(cities)
+    if N < 200:
+        tours = rng.random_sample((size, N)).argsort(axis=1)
+    else:
+        # for more cities this is faster than sorting random numbers:
+        tours = np.empty((size, N), dtype=np.intp)
+        for tour in tours:
+            tour[:] = rng.permutation(N)
+    x, y = cities[:, 0][tours], cities[:, 1][tours]
+    lengths = np.hypot(x[:, 0] - x[:, -1], y[:, 0] - y[:, -1])
+    lengths += np.hypot(np.diff(x, axis=1), np.diff(y, axis=1)).sum(axis=1)
+    return tours, lengths
+
+
+########################################################################
+# Random moves for simulated annealing:
+def annealing_moves(N, size, rng, knn=None):
+    # block of size random moves for simulated annealing, drawn at once
+    # from the numpy RandomState rng, as list of tuples (kind, i, j, t):
+    # without candidate lists knn the moves of simulated_annealing() (kind
+    # 0: reverse, 1: insert, 2: swap; i, j as for random.randint() there),
+    # with them the ones of neighbour_annealing() (kind 0: 2-opt, L = 1 ...
+    # 3: Or-opt of L cities; random city i and one of its neighbours j);
+    # t is an exponential random number for the acceptance test, an uphill
+    # move is accepted if beta * delta < t, i.e. with probability
+    # exp(- beta * delta)
+    r = rng.random_sample((3, size))
+    if knn is None:
+        kind = (r[0] >= 0.2).astype(np.intp) + (r[0] >= 0.6)
+        lo = np.minimum(kind, 1)
+        i = lo + (r[1] * (np.array([N // 2, N - 1, N - 1])[kind] + 1 - lo)).astype(np.intp)
+        j = lo + (r[2] * (np.array([N // 2, N - 2, N - 1])[kind] + 1 - lo)).astype(np.intp)
+    else:
+        kind = np.where(r[0] < 0.5, 0, 1 + ((r[0] - 0.5) * 6.0).astype(np.intp))
+        i = (r[1] * N).astype(np.intp)
+        j = knn[i, (r[2] * knn.shape[1]).astype(np.intp)]
+    return zip(kind.tolist(), i.tolist(), j.tolist(), rng.standard_exponential(size).tolist())
+
+
+########################################################################
+# simulation step for simulated annealing:
+#
+# The main part of the code for this function was provided by Werner Krauth
+# and his team from Ecole Normale Superieure as part of the course
+# "Statistical Mechanics - Algorithms and Computations" which was hosted
+# on the Coursera Platform (https://www.coursera.org/course/smac)
+# For an explanation of the simulated annealing method see
+# https://en.wikipedia.org/wiki/Simulated_annealing
+# Basically, in each iteration a "neighbouring" route is chosen and:
+# - if it has lower energy than the current route (i.e. is shorter): it is
+#   always accepted
+# - if it has higher energy than the current route (i.e. is longer): it is
+#   accepted with some probability p which depends on the difference in energies
+#   and a "temperature" which slowly decreases during the simulation. The
+#   parameter beta is basically the inverse temperature
+#
+def simulated_annealing(N, cities, proposal, beta, n_accept, energy, best_energy, dist, keep_uphill=False, counts=None):
+    # the tour length change of a proposed move is computed from the few
+    # edges it touches only, and the current tour length ("energy") is
+    # carried from call to call, so a step costs O(1) instead of O(N)
+    # (the move is only carried out if it is accepted); cities is the
+    # tour as an array of city indices, which is changed in place, dist(i, j)
+    # is the distance backend, proposal the random move from
+    # annealing_moves(); accepted moves which make the tour longer only
+    # count for the cooling schedule and are dropped, i.e. every step
+    # starts from the best tour found so far, unless keep_uphill is set
+    # (plain Metropolis chain); n_accept counts the accepted moves for the
+    # cooling schedule (see TSP_cooling.py), which changes beta between
+    # steps; counts (optional) is a dictionary move type -> [proposed,
+    # accepted, improved], see CountMoves() of the engines; returns the
+    # tour, n_accept, the current and the shortest tour length and whether
+    # the tour is a new shortest one
+    new_route = False
+    kind, i, j, t = proposal
+    if kind == 0:
+        # cut sequence somewhere in first half, swap first and second part,
+        # cut again at new point in first half and reverse first part;
+        # rotating the tour doesn't change its length, reversing the
+        # segment cities[i:i + j] replaces the edges at both of its ends
+        if j < 2:
+            delta = 0.0
+        else:
+            a, b = cities[i - 1], cities[i]
+            c, d = cities[(i + j - 1) % N], cities[(i + j) % N]
+            delta = dist(a, c) + dist(b, d) - dist(a, b) - dist(c, d)
+    elif kind == 1:
+        # move randomly chosen city to a randomly chosen new position in sequence;
+        # (i, j) are the pop and insert positions, k maps a position in the
+        # shortened sequence back to a position in cities
+        a = cities[i]
+        prev, next = cities[i - 1], cities[(i + 1) % N]
+        k = j - 1 if j - 1 < i else j
+        l = j if j < i else j + 1
+        c, d = cities[k], cities[l % N]
+        delta = dist(prev, next) - dist(prev, a) - dist(a, next) + \
+                dist(c, a) + dist(a, d) - dist(c, d)
+    else:
+        # swap two randomly chosen cities
+        if i > j:
+            i, j = j, i
+        a, b, c = cities[i - 1], cities[i], cities[(i + 1) % N]
+        e, f, g = cities[j - 1], cities[j], cities[(j + 1) % N]
+        if i == j:
+            delta = 0.0
+        elif j == i + 1:
+            delta = dist(a, f) + dist(b, g) - dist(a, b) - dist(f, g)
+        else:
+            delta = dist(a, f) + dist(f, c) + dist(e, b) + dist(b, g) - \
+                    dist(a, b) - dist(b, c) - dist(e, f) - dist(f, g)
+    if counts is not None:
+        count = counts[("reverse", "insert", "swap")[kind]]
+        count[0] += 1
+    if delta <= 0.0 or beta * delta < t:
+        # accept new route with probability depending on difference in
+        # tour length (new - current) and parameter beta (shorter routes
+        # are always accepted)
+        n_accept += 1
+        if counts is not None:
+            count[1] += 1
+        if delta >= 0.0 and not keep_uphill:
+            return cities, n_accept, energy, best_energy, new_route
+        energy += delta
+        if kind == 0:
+            # rotation is left out, it gives the same (cyclic) tour
+            cities[i:i + j] = cities[i:i + j][::-1]
+        elif kind == 1:
+            cities.insert(j, cities.pop(i))
+        else:
+            cities[i], cities[j] = cities[j], cities[i]
+        if energy < best_energy:
+           best_energy = energy
+           new_route = True
+           if counts is not None:
+               count[2] += 1
+    return cities, n_accept, energy, best_energy, new_route
+
+
+
+########################################################################
+# Moves for tours with position array pos (pos[tour[i]] == i), both are
+# changed in place:
+def reverse_path(tour, pos, u, v):
+    # reverse the path from city u to city v (in tour direction); the rest
+    # of the tour is reversed instead if that is shorter, which gives the
+    # same cyclic tour
+    N = len(tour)
+    i, j = pos[u], pos[v]
+    m = (j - i) % N + 1
+    if 2 * m > N:
+        i, j, m = (j + 1) % N, (i - 1) % N, N - m
+    if m <= SHORT_PATH:
+        for k in xrange(m // 2):
+            a, b = tour[i], tour[j]
+            tour[i], tour[j] = b, a
+            pos[a], pos[b] = j, i
+            i = i + 1 if i < N - 1 else 0
+            j = j - 1 if j > 0 else N - 1
+    else:
+        t = np.frombuffer(tour, dtype=np.intc)
+        p = np.frombuffer(pos, dtype=np.intc)
+        index = np.arange(i, i + m) % N
+        path = t[index][::-1]
+        t[index] = path
+        p[path] = index
+
+def two_opt_move(tour, pos, a, b, c, d):
+    # replace edges (a, b) and (c, d) by (a, c) and (b, d); b must follow a
+    # and d must follow c in the same direction
+    if tour[(pos[a] + 1) % len(tour)] == b:
+        reverse_path(tour, pos, b, c)
+    else:
+        reverse_path(tour, pos, c, b)
+
+def or_opt_move(tour, pos, p, s1, s2, n, c, d, reverse):
+    # move path s1 ... s2 (between cities p and n) between the neighbouring
+    # cities c and d, as c s2 ... s1 d if reverse is set, as c s1 ... s2 d
+    # otherwise; d must follow c in the same direction as s1 follows p
+    two_opt_move(tour, pos, p, s1, c, d)    # p c ... n s2 ... s1 d
+    two_opt_move(tour, pos, p, c, n, s2)    # p n ... c s2 ... s1 d
+    if not reverse:
+        two_opt_move(tour, pos, c, s2, s1, d)
+
+
+########################################################################
+# simulation step for simulated annealing with moves between near
+# neighbours, for large numbers of cities: a random city a and one of
+# its nearest neighbours c (candidate lists knn from TSP_spatial, see
+# annealing_moves()) are chosen and either
+# - a 2-opt move connects a with c (and their successors with each other)
+# - an Or-opt move inserts the path of 1 to 3 cities starting at a next
+#   to c (in the better of both directions)
+# the tour length change is again computed from the touched edges only;
+# pos is the position array of tour (see above), otherwise arguments and
+# return values are the same as for simulated_annealing()
+def neighbour_annealing(N, cities, pos, proposal, beta, n_accept, energy, best_energy, dist, keep_uphill=False, counts=None):
+    tour = cities
+    new_route = False
+    L, a, c, t = proposal
+    i, j = pos[a], pos[c]
+    an = tour[i + 1 if i < N - 1 else 0]
+    two_opt = L == 0
+    if two_opt:
+        # 2-opt move:
+        cn = tour[j + 1 if j < N - 1 else 0]
+        if c == an or cn == a:
+            delta = 0.0
+            move = None
+        else:
+            delta = dist(a, c) + dist(an, cn) - dist(a, an) - dist(c, cn)
+            move = (a, an, c, cn)
+    else:
+        # Or-opt move of path a ... s2 with L cities:
+        if (j - i) % N < L or (i - j) % N <= 2:
+            # c is on the path or just before it (or before its predecessor,
+            # the same as moving that one behind the path)
+            delta = 0.0
+            move = None
+        else:
+            p = tour[i - 1]
+            s2 = tour[(i + L - 1) % N]
+            n = tour[(i + L) % N]
+            d = tour[j + 1 if j < N - 1 else 0]
+            removed = dist(p, a) + dist(s2, n) + dist(c, d) - dist(p, n)
+            forward = dist(c, a) + dist(s2, d)
+            backward = dist(c, s2) + dist(a, d)
+            delta = min(forward, backward) - removed
+            move = (p, a, s2, n, c, d, backward < forward)
+    if counts is not None:
+        count = counts["2-opt" if two_opt else "or-opt"]
+        count[0] += 1
+    if delta <= 0.0 or beta * delta < t:
+        n_accept += 1
+        if counts is not None:
+            count[1] += 1
+        if move is None or (delta >= 0.0 and not keep_uphill):
+            return cities, n_accept, energy, best_energy, new_route
+        energy += delta
+        if two_opt:
+            two_opt_move(tour, pos, *move)
+        else:
+            or_opt_move(tour, pos, *move)
+        if energy < best_energy:
+           best_energy = energy
+           new_route = True
+           if counts is not None:
+               count[2] += 1
+    return cities, n_accept, energy, best_energy, new_route
+
+
+########################################################################
+# Local search ("polishing"): 2-opt and Or-opt moves which make the tour
+# shorter are carried out until there are none left, i.e. the tour is a
+# local optimum for these moves. Only moves which connect a city with one
+# of its nearest neighbours (candidate lists knn, sorted by distance) are
+# tried, and a city is looked at again only after one of its tour edges
+# has changed (a queue of cities whose "don't-look bit" is off), so the
+# work grows about linearly with N; the result doesn't depend on random
+# numbers.
+def improve_city(tour, pos, knn, dist, a):
+    # look for a move at city a which makes the tour shorter, in both tour
+    # directions (step); the first one found is carried out; returns the
+    # change of the tour length and the cities at the changed edges, None
+    # if there is no such move
+    N = len(tour)
+    i = pos[a]
+    for step in (1, -1):
+        an = tour[(i + step) % N]
+        d_a = dist(a, an)
+        # 2-opt move, edges (a, an) and (c, cn) are replaced by (a, c) and
+        # (an, cn); the neighbours are sorted, so no closer c is left once
+        # (a, c) is as long as (a, an):
+        for c in knn[a]:
+            d_ac = dist(a, c)
+            if d_ac >= d_a:
+                break
+            cn = tour[(pos[c] + step) % N]
+            if c == an or cn == a:
+                continue
+            delta = d_ac + dist(an, cn) - d_a - dist(c, cn)
+            if delta < -POLISH_GAIN:
+                if step == 1:
+                    two_opt_move(tour, pos, a, an, c, cn)
+                else:
+                    two_opt_move(tour, pos, an, a, cn, c)
+                return delta, (a, an, c, cn)
+        # Or-opt move of the path a ... s2 of L cities (in direction step)
+        # between c and d, checked as in neighbour_annealing():
+        p = tour[(i - step) % N]
+        for L in (1, 2, 3):
+            s2 = tour[(i + step * (L - 1)) % N]
+            n = tour[(i + step * L) % N]
+            gain = dist(p, a) + dist(s2, n) - dist(p, n)
+            for c in knn[a]:
+                if dist(a, c) >= gain:
+                    break
+                offset = ((pos[c] - i) * step) % N
+                if offset < L or offset >= N - 2:
+                    continue
+                d = tour[(pos[c] + step) % N]
+                forward = dist(c, a) + dist(s2, d)
+                backward = dist(c, s2) + dist(a, d)
+                delta = min(forward, backward) - dist(c, d) - gain
+                if delta < -POLISH_GAIN:
+                    or_opt_move(tour, pos, p, a, s2, n, c, d, backward < forward)
+                    return delta, (p, a, s2, n, c, d)
+    return None
+
+def local_search(tour, pos, knn, dist, energy):
+    # polish tour (array of city indices with position array pos, both are
+    # changed in place) of length energy; knn are the candidate lists as
+    # nested lists; returns new tour length and number of moves made
+    N = len(tour)
+    queue = deque(tour)
+    queued = bytearray(b"\x01" * N)     # don't-look bit of city k is off if queued[k]
+    moves, checked = 0, 0
+    while queue:
+        a = queue.popleft()
+        queued[a] = 0
+        move = improve_city(tour, pos, knn, dist, a)
+        if move is not None:
+            delta, touched = move
+            energy += delta
+            moves += 1
+            for city in touched:
+                if not queued[city]:
+                    queued[city] = 1
+                    queue.append(city)
+        if not queue and moves > checked:
+            # a move can also open up moves at cities away from the changed
+            # edges, so all cities are looked at again until that finds none
+            checked = moves
+            queue.extend(tour)
+            queued = bytearray(b"\x01" * N)
+    return energy, moves
+
+
+########################################################################
+# Engines, keep the state of a simulation between calls; Run(steps) does
+# the given number of iterations and returns True if a shorter tour has
+# been found; best tour and its length are in best and best_energy;
+# after CountMoves() counts is a dictionary move type -> [proposed,
+# accepted, improved] (None otherwise, the default, as it costs time):
+class DirectSampling():
+
+    def __init__(self, cities, dist, seed=None, block=BLOCK):
+        self.N = len(cities)
+        self.cities = cities
+        self.dist = dist
+        self.rng = random.Random(seed)
+        self.tour = array('i', range(self.N))   # tour shuffled in each iteration
+        self.best = self.tour[:]
+        self.best_energy = float('inf')
+        self.iters = 0
+        self.best_iter = 0
+        # block of random tours (see direct_sampling_block()), used up one
+        # tour per iteration:
+        self.block = max(1, min(block, BLOCK_ELEMENTS // self.N))
+        self.nprng = np.random.RandomState(numpy_seed(seed))
+        self.tours, self.lengths, self.next = None, None, 0
+        self.block_rng = None   # state of nprng before current block was generated
+        self.counts = None
+
+    def CountMoves(self):
+        # a random tour is kept only if it is shorter than the best one
+        self.counts = {"shuffle": [0, 0, 0]}
+
+    def Run(self, steps):
+        if self.block > 1:
+            return self.RunBlocks(steps)
+        N, dist, rng, tour, best = self.N, self.dist, self.rng, self.tour, self.best
+        new_route = False
+        for k in xrange(steps):
+            direct_sampling(tour, rng)
+            energy = tour_length(tour, N, dist)
+            if energy < self.best_energy:
+                # keep new route, old one can be shuffled next time:
+                self.best_energy = energy
+                self.best_iter = self.iters + k + 1
+                tour, best = best, tour
+                new_route = True
+                if self.counts is not None:
+                    self.counts["shuffle"][1] += 1
+                    self.counts["shuffle"][2] += 1
+        if self.counts is not None:
+            self.counts["shuffle"][0] += steps
+        self.iters += steps
+        self.tour, self.best = tour, best
+        return new_route
+
+    def RunBlocks(self, steps):
+        new_route = False
+        while steps > 0:
+            if self.tours is None or self.next == len(self.lengths):
+                self.block_rng = self.nprng.get_state()
+                self.tours, self.lengths = direct_sampling_block(self.cities, self.block, self.nprng)
+                self.next = 0
+            m = min(steps, len(self.lengths) - self.next)
+            if self.counts is not None:
+                # number of tours shorter than all tours before them:
+                lengths = np.minimum.accumulate(np.append(self.best_energy, self.lengths[self.next:self.next + m]))
+                improved = int((lengths[1:] < lengths[:-1]).sum())
+                count = self.counts["shuffle"]
+                count[0], count[1], count[2] = count[0] + m, count[1] + improved, count[2] + improved
+            k = self.next + self.lengths[self.next:self.next + m].argmin()
+            if self.lengths[k] < self.best_energy:
+                self.best_energy = float(self.lengths[k])
+                self.best_iter = self.iters + k - self.next + 1
+                self.best = array('i', self.tours[k])
+                new_route = True
+            self.next += m
+            self.iters += m
+            steps -= m
+        return new_route
+
+    def GetState(self):
+        # complete state as (picklable) dictionary, see SimulatedAnnealing;
+        # instead of the current block the state of the numpy generator it
+        # was generated from is kept, SetState() generates it again
+        return {"tour": self.tour, "best": self.best, "best_energy": self.best_energy,
+                "iters": self.iters, "best_iter": self.best_iter, "block": self.block,
+                "next": self.next, "rng": self.rng.getstate(),
+                "nprng": self.nprng.get_state(), "block_rng": self.block_rng}
+
+    def SetState(self, state):
+        for key, value in state.items():
+            if key == "rng":
+                self.rng.setstate(value)
+            elif key != "nprng":
+                setattr(self, key, value)
+        if "block_rng" in state:
+            self.tours, self.lengths = None, None
+            if self.block_rng is not None:
+                self.nprng.set_state(self.block_rng)
+                self.tours, self.lengths = direct_sampling_block(self.cities, self.block, self.nprng)
+        if "nprng" in state:
+            self.nprng.set_state(state["nprng"])
+
+
+class SimulatedAnnealing():
+    # with candidate lists knn (see TSP_spatial.nearest_neighbours()) the
+    # moves of neighbour_annealing() are used; tour is the initial tour;
+    # schedule is the cooling schedule (see TSP_cooling.py), by default
+    # the classic one with factor cooling; keep_uphill (default: as the
+    # schedule needs it) is explained at simulated_annealing(); the best
+    # tour is polished (see Polish()) every polish_every iterations
+    # (0: only when Polish() is called); the random moves come in blocks
+    # from a numpy generator of the engine (see annealing_moves())
+
+    def __init__(self, cities, dist, seed=None, beta=1.0, keep_uphill=None, cooling=1.005, knn=None, tour=None, schedule=None, polish_every=0):
+        self.N = len(cities)
+        self.cities = cities
+        self.dist = dist
+        self.nprng = np.random.RandomState(numpy_seed(seed))
+        self.moves, self.next = [], 0           # block of random moves, used up one per iteration
+        self.block_rng = None                   # state of nprng before current block was generated
+        self.knn = knn
+        self.tour = array('i', range(self.N) if tour is None else tour)  # current tour of the Markov chain
+        self.pos = None
+        self.energy = tour_length(self.tour, self.N, dist)
+        self.best = self.tour[:]
+        self.best_energy = self.energy
+        self.beta = beta                        # inverse temperature
+        self.schedule = TSP_cooling.ClassicSchedule(cooling) if schedule is None else schedule
+        self.keep_uphill = self.schedule.keep_uphill if keep_uphill is None else keep_uphill
+        self.n_accept = 0
+        self.iters = 0
+        self.best_iter = 0
+        self.counts = None
+        self.polish_every = polish_every
+        self.polished = 0                       # iteration number of last polishing
+        self.candidates = None                  # candidate lists for Polish()
+        self.SetState({"tour": self.tour})
+        self.beta = self.schedule.Start(self)
+
+    def CountMoves(self):
+        moves = ("reverse", "insert", "swap") if self.knn is None else ("2-opt", "or-opt")
+        self.counts = dict((move, [0, 0, 0]) for move in moves)
+
+    def Moves(self):
+        # new block of random moves
+        self.block_rng = self.nprng.get_state()
+        self.moves = annealing_moves(self.N, PROPOSALS, self.nprng, self.knn)
+        return self.moves
+
+    def Run(self, steps):
+        N, dist, tour, keep_uphill, schedule = self.N, self.dist, self.tour, self.keep_uphill, self.schedule
+        beta, n_accept, energy, best_energy = self.beta, self.n_accept, self.energy, self.best_energy
+        pos, knn, counts = self.pos, self.knn, self.counts
+        moves, next = self.moves, self.next
+        size = len(moves)
+        # the schedule is asked for a new beta after limit accepted moves or
+        # at step stop of this run:
+        limit, stop = schedule.limit, schedule.next - self.iters
+        new_route = False
+        for k in xrange(steps):
+            if n_accept >= limit or k >= stop:
+                beta, n_accept = schedule.Update(beta, n_accept, self.iters + k, self)
+                limit, stop = schedule.limit, schedule.next - self.iters
+            if next == size:
+                moves, next = self.Moves(), 0
+                size = len(moves)
+            proposal = moves[next]
+            next += 1
+            if knn is None:
+                tour, n_accept, energy, best_energy, improved = simulated_annealing(N, tour, proposal, beta, n_accept, energy, best_energy, dist, keep_uphill, counts)
+            else:
+                tour, n_accept, energy, best_energy, improved = neighbour_annealing(N, tour, pos, proposal, beta, n_accept, energy, best_energy, dist, keep_uphill, counts)
+            if improved:
+                if keep_uphill:
+                    self.best = tour[:]
+                self.best_iter = self.iters + k + 1
+                new_route = True
+            if CHECK_ENERGY and (self.iters + k + 1) % CHECK_ENERGY == 0:
+                # debug mode: detect drift of incrementally updated tour length
+                assert abs(energy - tour_length(tour, N, dist)) < 1e-9 * N, "WTF?? " + str(energy) + " vs " + str(tour_length(tour, N, dist))
+        if new_route and not keep_uphill:
+            # current tour is the best one
+            self.best = tour[:]
+        self.iters += steps
+        self.tour, self.beta, self.n_accept, self.energy, self.best_energy = tour, beta, n_accept, energy, best_energy
+        self.next = next
+        if self.polish_every and self.iters - self.polished >= self.polish_every:
+            new_route = self.Polish() or new_route
+        return new_route
+
+    def Polish(self):
+        # local search on the best tour (see local_search()), with the
+        # candidate lists of the neighbour moves or, for fewer cities, lists
+        # made for it; without keep_uphill the chain continues from the
+        # polished tour; returns True if the tour got shorter
+        self.polished = self.iters
+        if self.N < 5:
+            return False
+        if self.candidates is None:
+            knn = self.knn if self.knn is not None else TSP_spatial.nearest_neighbours(self.cities)
+            self.candidates = knn.tolist()
+        tour = self.best[:]
+        pos = array('i', [0]) * self.N
+        for i, city in enumerate(tour):
+            pos[city] = i
+        energy, moves = local_search(tour, pos, self.candidates, self.dist, self.best_energy)
+        if moves == 0 or energy >= self.best_energy:
+            return False
+        self.best, self.best_energy, self.best_iter = tour, energy, self.iters
+        if not self.keep_uphill:
+            self.SetState({"tour": tour[:], "energy": energy})
+        return True
+
+    def GetState(self):
+        # complete state of the simulation as (picklable) dictionary, e.g. to
+        # move it to another process; distances and candidate lists are not
+        # included, the block of random moves as for DirectSampling
+        return {"tour": self.tour, "energy": self.energy, "best": self.best,
+                "best_energy": self.best_energy, "beta": self.beta,
+                "keep_uphill": self.keep_uphill, "schedule": self.schedule,
+                "n_accept": self.n_accept, "iters": self.iters,
+                "best_iter": self.best_iter, "polish_every": self.polish_every,
+                "polished": self.polished, "next": self.next,
+                "nprng": self.nprng.get_state(), "block_rng": self.block_rng}
+
+    def SetState(self, state):
+        # continue simulation from state returned by GetState()
+        for key, value in state.items():
+            if key != "nprng":
+                setattr(self, key, value)
+        if "block_rng" in state:
+            self.moves = []
+            if self.block_rng is not None:
+                self.nprng.set_state(self.block_rng)
+                self.moves = annealing_moves(self.N, PROPOSALS, self.nprng, self.knn)
+        if "nprng" in state:
+            self.nprng.set_state(state["nprng"])
+        if self.knn is not None and "tour" in state:
+            self.pos = array('i', [0]) * self.N
+            for i, city in enumerate(self.tour):
+                self.pos[city] = i
+
+
+def make_engine(name, cities, dist, seed=None, block=BLOCK, start="random", schedule=None, polish_every=POLISH_EVERY, knn=None):
+    # create engine by name, see ENGINES, with a random number stream of its
+    # own derived from seed (see STREAMS); block is the block size for
+    # direct sampling; simulated annealing starts from a random tour or
+    # with start="curve" from a space-filling curve, uses neighbour moves
+    # from NEIGHBOUR_N cities on and the cooling schedule of that name
+    # (see TSP_cooling.py, default depends on the number of cities), its
+    # best tour is polished every polish_every iterations; knn are the
+    # candidate lists of the neighbour moves (default: made for cities)
+    if name == "direct":
+        return DirectSampling(cities, dist, sub_seed(seed, STREAMS["direct"]), block)
+    elif name == "simann":
+        if len(cities) < NEIGHBOUR_N:
+            knn = None
+        elif knn is None:
+            knn = TSP_spatial.nearest_neighbours(cities)
+        tour = TSP_spatial.space_filling_tour(cities) if start == "curve" else None
+        return SimulatedAnnealing(cities, dist, sub_seed(seed, STREAMS["simann"]), knn=knn, tour=tour, schedule=TSP_cooling.make_schedule(schedule, len(cities)), polish_every=polish_every)
+    raise ValueError("unknown engine: " + str(name))
+
+
+########################################################################
+# Headless mode, no graphics at all:
+def run_headless(N, iters=None, time_budget=None, seed=None, engines=("direct", "simann"), block=BLOCK, start="random", verbose=False, stats=None, log=None, checkpoint=None, resume=False, schedule=None, instance=None,
+                 polish=POLISH, polish_every=POLISH_EVERY, stop=True):
+    # run each engine on the same N random cities until the iteration count
+    # iters and/or the time budget (in seconds) is used up; returns
+    # dictionary with the results, which can be written with save_results();
+    # stats (TSP_stats.Stats, optional) gets time per engine and moves, log
+    # (TSP_record.Recorder, optional) the shortest tour length vs iteration;
+    # with checkpoint (filename) the state of the run is saved every
+    # CHECKPOINT_TIME seconds and whenever an engine is done, with resume
+    # the run continues from that file if it exists (with N, seed, engines
+    # and cities from there), for an iteration count with exactly the same
+    # results as without interruption; schedule is the name of the cooling
+    # schedule for simulated annealing (default depends on N); with
+    # instance (TSP_instance.Instance) its cities are used instead of N
+    # random ones, the results then give the file name instead of the
+    # cities and the tour lengths in the distances of the file as well;
+    # with polish the best tour of simulated annealing is polished by
+    # local search at the end (see SimulatedAnnealing.Polish()), with
+    # polish_every also every that many iterations; with stop simulated
+    # annealing ends as soon as it has converged (see TSP_stopping.py),
+    # the reason why an engine stopped is given in the results
+    assert iters or time_budget, "need iteration count and/or time budget"
+    saved = load_checkpoint(checkpoint) if resume and os.path.exists(checkpoint) else None
+    if saved is not None:
+        assert "current" in saved, "WTF?? not a checkpoint of a headless run: " + checkpoint
+        N, seed, engines, block, start, cities = saved["N"], saved["seed"], saved["engines"], saved["block"], saved["start"], saved["cities"]
+        instance = TSP_instance.load(saved["instance"]) if saved.get("instance") else None
+        if verbose: print "Resuming from checkpoint", checkpoint
+    elif instance is None:
+        cities = generate_cities(N, seed)
+    if instance is not None:
+        N, cities = instance.N, instance.cities
+    dist = make_distances(cities)
+    knn = instance.Neighbours() if instance is not None and N >= NEIGHBOUR_N else None
+    results = {"N": N, "seed": seed, "engines": {} if saved is None else saved["results"]}
+    if instance is None:
+        results["cities"] = cities.tolist()
+    else:
+        results.update(instance.Info())
+
+    def snapshot(name, engine, elapsed):
+        # state of the run, engine name is running (None: between engines);
+        # cities of an instance are loaded from its file again
+        return {"N": N, "seed": seed, "engines": list(engines), "block": block, "start": start,
+                "cities": cities if instance is None else None, "instance": instance and instance.filename,
+                "results": results["engines"], "current": name,
+                "state": engine.GetState() if name else None, "elapsed": elapsed}
+
+    for name in engines:
+        if name in results["engines"]:
+            # done before the checkpoint
+            continue
+        engine = make_engine(name, cities, dist, seed, block, start, schedule, polish_every, knn)
+        elapsed = 0.0
+        if saved is not None and saved["current"] == name:
+            engine.SetState(saved["state"])
+            elapsed = saved["elapsed"]
+        if stats is not None:
+            engine.CountMoves()
+        begin = timeit.default_timer() - elapsed
+        saved_at = elapsed
+        criteria = TSP_stopping.Criteria(iters, time_budget) if stop else TSP_stopping.Criteria(iters, time_budget, 0, 0)
+        while True:
+            reason = criteria.Check(engine, elapsed)
+            if reason:
+                break
+            steps = CHUNK if iters is None else min(CHUNK, iters - engine.iters)
+            improved = engine.Run(steps)
+            now = timeit.default_timer() - begin
+            if improved and log is not None:
+                log.Add(name, engine.best_iter, engine.best_energy, now)
+            if stats is not None:
+                stats.Add(name, now - elapsed)
+                stats.Tick({name: engine}, N=N)
+            elapsed = now
+            if checkpoint and elapsed - saved_at >= CHECKPOINT_TIME:
+                save_checkpoint(snapshot(name, engine, elapsed), checkpoint)
+                saved_at = elapsed
+        annealed, polish_time = engine.best_energy, 0.0
+        if polish and hasattr(engine, "Polish"):
+            t0 = timeit.default_timer()
+            if engine.Polish() and log is not None:
+                log.Add(name, engine.best_iter, engine.best_energy, elapsed)
+            polish_time = timeit.default_timer() - t0
+            if stats is not None:
+                stats.Add("polish", polish_time)
+        if stats is not None:
+            stats.Dump({name: engine}, N=N)
+        results["engines"][name] = {"iters": engine.iters, "time": elapsed,
+                                    "iters_per_sec": engine.iters / elapsed if elapsed > 0 else None,
+                                    "length": engine.best_energy, "best_iter": engine.best_iter,
+                                    "tour": engine.best.tolist(), "stopped": reason}
+        if polish and hasattr(engine, "Polish"):
+            results["engines"][name].update({"annealed_length": annealed, "polish_time": polish_time})
+        if instance is not None:
+            add_instance_length(results["engines"][name], instance)
+        if checkpoint:
+            save_checkpoint(snapshot(None, None, 0.0), checkpoint)
+        if verbose: print_results(results, [name])
+    return results
+
+def add_instance_length(result, instance):
+    # length of the tour of a result in the distances of the instance
+    # file, and relative excess over the optimum (if known)
+    result["instance_length"] = instance.Length(result["tour"])
+    result["gap"] = instance.Gap(result["instance_length"])
+
+def print_results(results, engines=None):
+    # print summary of headless run
+    for name in engines or sorted(results["engines"]):
+        r = results["engines"][name]
+        text = [ENGINES[name] + ":", "N =", results["N"], "/ iterations:", r["iters"], "/ time:", round(r["time"], 3), "s",
+                "/ iters/sec:", int(round(r["iters_per_sec"] or 0)), "/ min. tour length:", round(r["length"], 5)]
+        if "annealed_length" in r:
+            text.append("(" + str(round(r["annealed_length"], 5)) + " before polishing)")
+        if r.get("stopped"):
+            text += ["/ stopped:", r["stopped"]]
+        if "instance_length" in r:
+            text += ["/", results["name"] + ":", r["instance_length"]]
+            if r["gap"] is not None:
+                text.append("(" + str(round(100 * r["gap"], 2)) + "% above optimum)")
+        print " ".join(str(t) for t in text)
+
+def save_results(results, filename):
+    # save results of headless run as JSON file
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=1)
+    return filename
+
+def save_checkpoint(state, filename):
+    # save state (dictionary, e.g. with states of engines) as binary file;
+    # it is written to a temporary file first, which then replaces the
+    # checkpoint, so an interruption never leaves a broken checkpoint
+    temp = filename + ".tmp"
+    with open(temp, "wb") as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.name == "nt" and os.path.exists(filename):
+        # rename doesn't replace files on Windows
+        os.remove(filename)
+    os.rename(temp, filename)
+    return filename
+
+def load_checkpoint(filename):
+    # load state saved by save_checkpoint()
+    with open(filename, "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,244 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), instances from files instead of
+# random cities:
+#
+# - TSPLIB .tsp files with NODE_COORD_SECTION and EDGE_WEIGHT_TYPE
+#   EUC_2D, CEIL_2D, ATT or GEO
+# - raw coordinates (extension .xy): x, y pairs as little-endian float64
+#
+# The file is parsed only once, the coordinates are stored in a .npy
+# file next to it (as given and normalised to the unit square like the
+# ones of TSP_engine.generate_cities(), so the GUI can draw them), which
+# is opened as memory-mapped array (copy-on-write, the solvers never
+# write to it); all processes working on the same instance (see
+# TSP_parallel.py) share its pages instead of holding a copy each, the
+# same goes for the candidate lists of the neighbour moves
+# (Neighbours()). The solvers work on the normalised coordinates,
+# Length() gives the length of a tour in the distances of the file (with
+# its rounding rules); the optimal tour length is taken from a .opt.tour
+# file next to the instance or from the COMMENT line, if there is one:
+#
+#   import TSP_instance
+#   instance = TSP_instance.load("att532.tsp")
+#   results = TSP_engine.run_headless(instance.N, iters=10**6, instance=instance)
+#
+########################################################################
+#
+# Import packages:
+import json
+import math
+import os
+import re
+import numpy as np
+import TSP_spatial
+
+########################################################################
+# Global settings:
+MARGIN = 0.025       # margin around normalised coordinates (as for random cities)
+RAW_EXTENSION = ".xy"  # extension of files with raw float64 coordinates
+METRICS = ("EUC_2D", "CEIL_2D", "ATT", "GEO", "EUC")  # distances of TSPLIB files; "EUC": not rounded, for raw files
+GEO_RADIUS = 6378.388  # earth radius (in km) of TSPLIB GEO distances
+GEO_PI = 3.141592    # value of pi used by TSPLIB for GEO distances
+
+
+########################################################################
+# Reading files:
+def read_tsplib(filename):
+    # read TSPLIB file, returns header (dictionary keyword -> value) and
+    # coordinates as (N, 2) array
+    header, coords = {}, []
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("NODE_COORD_SECTION"):
+                break
+            if ":" in line:
+                key, value = line.split(":", 1)
+                header[key.strip().upper()] = value.strip()
+            elif line and line != "EOF":
+                raise ValueError("section not supported: " + line + " (" + filename + ")")
+        for line in f:
+            fields = line.split()
+            if not fields or not fields[0].lstrip("-").isdigit():
+                break
+            coords.append((float(fields[1]), float(fields[2])))
+    if header.get("TYPE", "TSP").split()[0] != "TSP":
+        raise ValueError("not a symmetric TSP: " + filename)
+    if header.get("EDGE_WEIGHT_TYPE") not in METRICS:
+        raise ValueError("edge weight type not supported: " + str(header.get("EDGE_WEIGHT_TYPE")) + " (" + filename + ")")
+    assert len(coords) == int(header.get("DIMENSION", len(coords))), "WTF?? " + str(len(coords)) + " coordinates in " + filename
+    return header, np.array(coords, dtype=np.float64).reshape(-1, 2)
+
+def read_raw(filename):
+    # raw coordinates, memory-mapped as (N, 2) array
+    return np.memmap(filename, dtype="<f8", mode="r").reshape(-1, 2)
+
+def read_tour(filename):
+    # tour of a TSPLIB .tour file, as list of 0-based city indices
+    tour = []
+    with open(filename) as f:
+        for line in f:
+            if line.strip().startswith("TOUR_SECTION"):
+                break
+        for line in f:
+            for field in line.split():
+                if int(field) < 0:
+                    return tour
+                tour.append(int(field) - 1)
+    return tour
+
+def parse_optimum(header):
+    # optimal tour length from the header of a TSPLIB file: keyword
+    # OPTIMUM / BEST_KNOWN or first number standing on its own after
+    # "optimal" or "best known" in the comment (TSPLIB itself keeps the
+    # optima in a separate list), None if not given
+    for key in ("OPTIMUM", "BEST_KNOWN"):
+        if key in header:
+            return float(header[key])
+    match = re.search(r"(optim|best known)(.*)", header.get("COMMENT", ""), re.IGNORECASE)
+    if match:
+        number = re.search(r"(?<![\w.])(\d+(\.\d+)?)(?![\w.])", match.group(2))
+        if number:
+            return float(number.group(1))
+    return None
+
+
+########################################################################
+# Distances and normalisation:
+def geo_radians(coords):
+    # TSPLIB GEO coordinates (latitude, longitude as DDD.MM) in radians
+    degrees = np.trunc(coords)
+    return GEO_PI * (degrees + 5.0 * (coords - degrees) / 3.0) / 180.0
+
+def edge_lengths(a, b, metric):
+    # lengths of the edges between the points a[k] and b[k] ((M, 2) arrays)
+    # in the distances of a TSPLIB file
+    if metric == "GEO":
+        a, b = geo_radians(a), geo_radians(b)
+        q1 = np.cos(a[:, 1] - b[:, 1])
+        q2 = np.cos(a[:, 0] - b[:, 0])
+        q3 = np.cos(a[:, 0] + b[:, 0])
+        d = np.trunc(GEO_RADIUS * np.arccos(np.clip(0.5 * ((1.0 + q1) * q2 - (1.0 - q1) * q3), -1.0, 1.0)) + 1.0)
+        # TSPLIB gives distance 0 between a city and itself:
+        return np.where((a == b).all(axis=1), 0.0, d)
+    d = np.hypot(a[:, 0] - b[:, 0], a[:, 1] - b[:, 1])
+    if metric == "EUC_2D":
+        return np.floor(d + 0.5)
+    elif metric == "CEIL_2D":
+        return np.ceil(d)
+    elif metric == "ATT":
+        r = d / math.sqrt(10.0)
+        t = np.floor(r + 0.5)
+        return t + (t < r)
+    return d
+
+def normalise(coords, metric):
+    # coordinates in MARGIN ... 1 - MARGIN with the aspect ratio kept and
+    # y pointing down as on the screen; GEO coordinates are projected
+    # (equirectangular) first, so the solvers' euclidean distances are
+    # close to the great circle distances
+    if metric == "GEO":
+        lat, lon = geo_radians(coords).T
+        x, y = lon * math.cos(lat.mean()), lat
+    else:
+        x, y = coords[:, 0], coords[:, 1]
+    x, y = x - x.min(), y.max() - y
+    span = max(x.max(), y.max(), 1e-12)
+    scale = (1.0 - 2 * MARGIN) / span
+    return np.column_stack((MARGIN + scale * (x + 0.5 * (span - x.max())), MARGIN + scale * (y + 0.5 * (span - y.max()))))
+
+
+########################################################################
+# Instances:
+class Instance():
+    # coords are the coordinates as given in the file, cities the
+    # normalised ones (both memory-mapped (N, 2) arrays); optimum is the
+    # optimal tour length in the distances of the file (None: unknown)
+
+    def __init__(self, filename, info, data):
+        self.filename = filename
+        self.name = info["name"]
+        self.comment = info["comment"]
+        self.metric = info["metric"]
+        self.optimum = info["optimum"]
+        self.coords, self.cities = data[0], data[1]
+        self.N = len(self.cities)
+
+    def Length(self, tour):
+        # length of tour (sequence of city indices) in the distances of the file
+        tour = np.asarray(tour)
+        return float(edge_lengths(self.coords[tour], self.coords[np.roll(tour, -1)], self.metric).sum())
+
+    def Gap(self, length):
+        # relative excess of length (distances of the file) over the optimum
+        return None if not self.optimum else length / self.optimum - 1.0
+
+    def Neighbours(self):
+        # candidate lists of the cities (see TSP_spatial.nearest_neighbours())
+        # as memory-mapped array, computed once and kept in a cache file
+        filename = self.filename + ".knn.npy"
+        if os.path.exists(filename) and os.path.getmtime(filename) >= os.path.getmtime(self.filename):
+            knn = np.load(filename, mmap_mode="r")
+            if knn.shape == (self.N, min(TSP_spatial.NEIGHBOURS, self.N - 1)):
+                return knn
+        temp = filename + ".%d.tmp" % os.getpid()
+        with open(temp, "wb") as f:
+            np.save(f, TSP_spatial.nearest_neighbours(self.cities))
+        os.rename(temp, filename)
+        return np.load(filename, mmap_mode="r")
+
+    def Info(self):
+        # description of the instance for results
+        return {"instance": self.filename, "name": self.name, "metric": self.metric, "optimum": self.optimum}
+
+
+def cache_names(filename):
+    # files with coordinates (.npy, see load()) and description (.json)
+    return filename + ".npy", filename + ".json"
+
+def build_cache(filename):
+    # read instance file and write the cache files; they are written to
+    # temporary files of this process first and renamed, so processes
+    # loading the instance at the same time never see half a file
+    base = os.path.basename(filename)
+    if filename.endswith(RAW_EXTENSION):
+        coords = read_raw(filename)
+        header = {"NAME": base[:-len(RAW_EXTENSION)], "EDGE_WEIGHT_TYPE": "EUC"}
+    elif filename.endswith(".tsp"):
+        header, coords = read_tsplib(filename)
+    else:
+        raise ValueError("unknown instance format (expected .tsp or " + RAW_EXTENSION + "): " + filename)
+    assert len(coords) >= 3, "WTF?? less than 3 cities in " + filename
+    data_file, info_file = cache_names(filename)
+    temp = ".%d.tmp" % os.getpid()
+    with open(data_file + temp, "wb") as f:
+        np.save(f, np.array([coords, normalise(coords, header["EDGE_WEIGHT_TYPE"])]))
+    os.rename(data_file + temp, data_file)
+    info = {"name": header.get("NAME", base), "comment": header.get("COMMENT"),
+            "metric": header["EDGE_WEIGHT_TYPE"], "optimum": parse_optimum(header)}
+    tour_file = os.path.splitext(filename)[0] + ".opt.tour"
+    if os.path.exists(tour_file):
+        tour = read_tour(tour_file)
+        assert sorted(tour) == range(len(coords)), "WTF?? not a tour of all cities: " + tour_file
+        info["optimum"] = Instance(filename, info, np.load(data_file, mmap_mode="r")).Length(tour)
+    with open(info_file + temp, "w") as f:
+        json.dump(info, f)
+    os.rename(info_file + temp, info_file)
+    return info
+
+def load(filename):
+    # instance from a file, the cache files are (re)built if they don't
+    # exist or are older than the file
+    data_file, info_file = cache_names(filename)
+    if all(os.path.exists(name) and os.path.getmtime(name) >= os.path.getmtime(filename) for name in (data_file, info_file)):
+        with open(info_file) as f:
+            info = json.load(f)
+    else:
+        info = build_cache(filename)
+    return Instance(filename, info, np.load(data_file, mmap_mode="c"))
+
+def describe(instance):
+    # one line description of an instance
+    return instance.name + " (" + str(instance.N) + " cities, " + instance.metric + ", optimum: " + \
+           ("unknown" if instance.optimum is None else str(instance.optimum)) + ")"
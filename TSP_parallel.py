@@ -0,0 +1,228 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), several simulated annealing chains
+# run in a pool of worker processes, one chain per core:
+#
+# - "tempering": parallel tempering (replica exchange), the chains run at
+#   fixed temperatures from a ladder, after every round neighbouring
+#   chains swap their tours with the usual Metropolis probability
+# - "restarts": independent annealing runs with a cooling schedule of
+#   TSP_cooling.py (default: the one for N cities), after every round
+#   the chain with the longest best tour restarts from the shortest tour
+#   found by any chain
+#
+# Used from the command line (python TSP_comparism_v10.py --headless
+# --chains 8 ...) or as Python module:
+#
+#   import TSP_parallel
+#   results = TSP_parallel.run_parallel(500, time_budget=60, seed=1)
+#
+########################################################################
+#
+# Import packages:
+import math
+import os
+import random
+import timeit
+import multiprocessing
+import TSP_engine
+import TSP_cooling
+import TSP_spatial
+import TSP_instance
+import TSP_stopping
+
+########################################################################
+# Global settings:
+CHAINS = multiprocessing.cpu_count()  # number of chains (and worker processes)
+ROUND = 20000        # iterations per chain between exchanges of tours
+BETA_HOT = 2.0       # inverse temperature of hottest chain (in units of sqrt(N))
+BETA_COLD = 200.0    # inverse temperature of coldest chain (in units of sqrt(N))
+MODES = ("tempering", "restarts")
+
+
+########################################################################
+# Worker processes, each one builds the distance backend once and then
+# continues any chain it gets from the state returned by GetState(); the
+# candidate lists for neighbour moves (knn) come from the parent, which
+# needs them for its engines as well; the cities of an instance file are
+# not sent to the workers, they open its memory-mapped cache (cities and
+# candidate lists):
+_cities, _dist, _knn = None, None, None
+
+def _init_worker(cities, filename=None, knn=None):
+    global _cities, _dist, _knn
+    instance = None if filename is None else TSP_instance.load(filename)
+    _cities = cities if instance is None else instance.cities
+    _dist = TSP_engine.make_distances(_cities)
+    if len(_cities) >= TSP_engine.NEIGHBOUR_N:
+        _knn = knn if instance is None else instance.Neighbours()
+
+def _run_chain(args):
+    state, steps = args
+    engine = TSP_engine.SimulatedAnnealing(_cities, _dist, knn=_knn)
+    engine.SetState(state)
+    engine.Run(steps)
+    return engine.GetState()
+
+
+########################################################################
+# Helper functions:
+def temperature_ladder(N, chains):
+    # inverse temperatures for parallel tempering, geometric sequence from
+    # BETA_HOT to BETA_COLD; typical edge lengths (and changes of the tour
+    # length by a move) scale like 1 / sqrt(N) for random cities
+    if chains == 1:
+        return [BETA_COLD * math.sqrt(N)]
+    return [BETA_HOT * math.sqrt(N) * (BETA_COLD / BETA_HOT) ** (k / (chains - 1.0)) for k in range(chains)]
+
+def exchange(states, rng, offset):
+    # replica exchange between neighbouring chains (k, k + 1) for k = offset,
+    # offset + 2, ...; configurations are swapped, the temperatures stay;
+    # returns number of attempted and accepted swaps
+    attempts, accepted = 0, 0
+    for k in range(offset, len(states) - 1, 2):
+        a, b = states[k], states[k + 1]
+        x = (a["beta"] - b["beta"]) * (a["energy"] - b["energy"])
+        attempts += 1
+        if x >= 0.0 or rng.uniform(0.0, 1.0) < math.exp(x):
+            a["tour"], b["tour"] = b["tour"], a["tour"]
+            a["energy"], b["energy"] = b["energy"], a["energy"]
+            accepted += 1
+    return attempts, accepted
+
+def share_best(states):
+    # chain with the longest best tour continues from the best tour of all
+    worst = max(states, key=lambda state: state["best_energy"])
+    best = min(states, key=lambda state: state["best_energy"])
+    if worst is not best:
+        worst["tour"], worst["energy"] = best["best"][:], best["best_energy"]
+        worst["best"], worst["best_energy"] = best["best"][:], best["best_energy"]
+
+
+########################################################################
+# Parallel run:
+def run_parallel(N, iters=None, time_budget=None, seed=None, chains=CHAINS, mode="tempering", steps=ROUND, callback=None, verbose=False, stats=None, instance=None, polish=TSP_engine.POLISH,
+                 start="random", polish_every=TSP_engine.POLISH_EVERY, stop=True, log=None, checkpoint=None, resume=False, schedule=None):
+    # run chains on N random cities in a process pool until every chain has
+    # done iters iterations and/or the time budget (in seconds) is used up;
+    # callback(round, best_energy, best_tour) is called after every round;
+    # stats (TSP_stats.Stats, optional) gets time spent running the chains
+    # and exchanging tours; instance (TSP_instance.Instance) replaces the
+    # N random cities; with polish the best tour is polished by local
+    # search at the end; returns results like TSP_engine.run_headless();
+    # start, polish_every, stop, log, checkpoint, resume and schedule (only
+    # for restarts, tempering has fixed temperatures) are explained there
+    # (with stop the run ends when the best tour of all chains hasn't
+    # improved for a while, see TSP_stopping.py, the log gets the total
+    # number of iterations of all chains)
+    assert iters or time_budget, "need iteration count and/or time budget"
+    saved = TSP_engine.load_checkpoint(checkpoint) if resume and os.path.exists(checkpoint) else None
+    if saved is not None:
+        assert "states" in saved, "WTF?? not a checkpoint of a parallel run: " + checkpoint
+        N, seed, chains, mode, cities = saved["N"], saved["seed"], saved["chains"], saved["mode"], saved["cities"]
+        instance = TSP_instance.load(saved["instance"]) if saved["instance"] else None
+        if verbose: print "Resuming from checkpoint", checkpoint
+    elif instance is None:
+        cities = TSP_engine.generate_cities(N, seed)
+    assert mode in MODES, "unknown mode: " + str(mode)
+    knn = None
+    if instance is not None:
+        N, cities = instance.N, instance.cities
+        if N >= TSP_engine.NEIGHBOUR_N:
+            knn = instance.Neighbours()     # also the cache file for the workers
+    elif N >= TSP_engine.NEIGHBOUR_N:
+        knn = TSP_spatial.nearest_neighbours(cities)
+    dist = TSP_engine.make_distances(cities)
+    tour = TSP_spatial.space_filling_tour(cities) if start == "curve" else None
+    # random number streams: one per chain and one for the exchanges, after
+    # the ones of the cities and the engines of TSP_engine.py
+    first = len(TSP_engine.STREAMS)
+    rng = random.Random(TSP_engine.sub_seed(seed, first + chains))
+    if mode == "tempering":
+        betas = temperature_ladder(N, chains)
+        engines = [TSP_engine.SimulatedAnnealing(cities, dist, TSP_engine.sub_seed(seed, first + k), beta, keep_uphill=True, cooling=1.0, knn=knn, tour=tour,
+                                                 polish_every=polish_every) for k, beta in enumerate(betas)]
+    else:
+        engines = [TSP_engine.SimulatedAnnealing(cities, dist, TSP_engine.sub_seed(seed, first + k), knn=knn, tour=tour,
+                                                 schedule=TSP_cooling.make_schedule(schedule, N), polish_every=polish_every) for k in range(chains)]
+    states = [engine.GetState() for engine in engines]
+    elapsed, rounds, attempts, accepted = 0.0, 0, 0, 0
+    best_energy, best_iter = float("inf"), 0     # shortest tour of all chains, found at this iteration per chain
+    if saved is not None:
+        states = saved["states"]
+        rng.setstate(saved["rng"])
+        elapsed, rounds, attempts, accepted, best_energy, best_iter = [saved[key] for key in ("elapsed", "rounds", "attempts", "accepted", "best_energy", "best_iter")]
+
+    def snapshot():
+        # state of the run; cities of an instance are loaded from its file again
+        return {"N": N, "seed": seed, "chains": chains, "mode": mode,
+                "cities": cities if instance is None else None, "instance": instance and instance.filename,
+                "states": states, "rng": rng.getstate(), "elapsed": elapsed, "rounds": rounds,
+                "attempts": attempts, "accepted": accepted, "best_energy": best_energy, "best_iter": best_iter}
+
+    criteria = TSP_stopping.Criteria(iters, time_budget) if stop else TSP_stopping.Criteria(iters, time_budget, 0, 0)
+    pool = multiprocessing.Pool(chains, _init_worker, (cities, None, knn) if instance is None else (None, instance.filename))
+    begin = timeit.default_timer() - elapsed
+    saved_at = elapsed
+    try:
+        while True:
+            reason = criteria.Budget(states[0]["iters"], elapsed) or criteria.Stalled(N, states[0]["iters"], best_iter)
+            if reason:
+                break
+            n = steps if iters is None else min(steps, iters - states[0]["iters"])
+            t0 = timeit.default_timer()
+            states = pool.map(_run_chain, [(state, n) for state in states])
+            t1 = timeit.default_timer()
+            if mode == "tempering":
+                a, b = exchange(states, rng, rounds % 2)
+                attempts += a
+                accepted += b
+            else:
+                share_best(states)
+            rounds += 1
+            elapsed = timeit.default_timer() - begin
+            best = min(states, key=lambda state: state["best_energy"])
+            if best["best_energy"] < best_energy:
+                best_energy, best_iter = best["best_energy"], states[0]["iters"]
+                if log is not None:
+                    log.Add(mode, sum(state["iters"] for state in states), best_energy, elapsed)
+            if stats is not None:
+                stats.Add("chains", t1 - t0)
+                stats.Add("exchange", timeit.default_timer() - t1)
+                stats.Count("rounds")
+                stats.Tick({}, N=N, iters=states[0]["iters"], best_energy=best["best_energy"])
+            if verbose:
+                print "round", rounds, "/ time:", round(elapsed, 3), "s / min. tour length:", round(best["best_energy"], 5)
+            if callback is not None:
+                callback(rounds, best["best_energy"], best["best"])
+            if checkpoint and elapsed - saved_at >= TSP_engine.CHECKPOINT_TIME:
+                TSP_engine.save_checkpoint(snapshot(), checkpoint)
+                saved_at = elapsed
+    finally:
+        pool.terminate()
+    if checkpoint:
+        TSP_engine.save_checkpoint(snapshot(), checkpoint)
+    best = min(states, key=lambda state: state["best_energy"])
+    total = sum(state["iters"] for state in states)
+    annealed = best["best_energy"]
+    if polish:
+        engine = engines[states.index(best)]
+        engine.SetState(best)
+        if engine.Polish() and log is not None:
+            log.Add(mode, total, engine.best_energy, elapsed)
+        best = engine.GetState()
+    result = {"iters": total, "time": elapsed,
+              "iters_per_sec": total / elapsed if elapsed > 0 else None,
+              "length": best["best_energy"], "best_iter": best["best_iter"],
+              "tour": best["best"].tolist(), "rounds": rounds, "stopped": reason,
+              "chains": [{"beta": state["beta"], "energy": state["energy"], "best_energy": state["best_energy"]} for state in states]}
+    if polish:
+        result["annealed_length"] = annealed
+    if mode == "tempering":
+        result["swap_rate"] = accepted / float(attempts) if attempts else None
+    if instance is None:
+        return {"N": N, "seed": seed, "cities": cities.tolist(), "engines": {mode: result}}
+    TSP_engine.add_instance_length(result, instance)
+    results = {"N": N, "seed": seed, "engines": {mode: result}}
+    results.update(instance.Info())
+    return results
@@ -0,0 +1,152 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), convergence log: the shortest tour
+# length found so far vs iteration number is written to a CSV file while
+# the simulation runs, with log-spaced downsampling (at most about two
+# rows per engine and relative step RESOLUTION in the iteration number),
+# so nothing grows in memory and the file stays small on long runs;
+# plots are made from the file, in a separate process for the GUI or
+# offline:
+#
+#   python TSP_record.py log.csv --image plot.png
+#
+########################################################################
+#
+# Import packages:
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+########################################################################
+# Global settings:
+RESOLUTION = 0.01    # relative distance in iteration number between two recorded rows
+
+
+class Recorder():
+    # without filename the log goes to a temporary file, which is deleted
+    # when the recorder is closed (or garbage collected)
+
+    def __init__(self, filename=None, resolution=RESOLUTION):
+        if filename is None:
+            self.file = tempfile.NamedTemporaryFile("w", prefix="TSP_log_", suffix=".csv")
+        else:
+            self.file = open(filename, "w")
+        self.filename = self.file.name
+        self.resolution = resolution
+        self.start = timeit.default_timer()
+        self.next = {}      # per engine: next iteration number to be recorded
+        self.pending = {}   # per engine: last row not recorded yet
+        self.file.write("engine,iteration,length,time\n")
+
+    def Add(self, engine, iteration, length, seconds=None):
+        # new shortest tour of an engine; seconds is the time since start of
+        # the engine (default: since creation of the recorder)
+        if seconds is None:
+            seconds = timeit.default_timer() - self.start
+        row = (engine, iteration, length, seconds)
+        if iteration < self.next.get(engine, 0):
+            self.pending[engine] = row
+            return
+        if engine in self.pending:
+            self.Write(self.pending.pop(engine))
+        self.Write(row)
+        self.next[engine] = iteration * (1.0 + self.resolution)
+
+    def Write(self, row):
+        self.file.write("%s,%d,%r,%.6f\n" % row)
+
+    def Flush(self):
+        # write rows kept back by the downsampling, so the file is complete
+        for engine in sorted(self.pending):
+            self.Write(self.pending[engine])
+        self.pending = {}
+        self.file.flush()
+
+    def Close(self):
+        if not self.file.closed:
+            self.Flush()
+            self.file.close()
+
+
+def read_log(filename):
+    # read convergence log, returns dictionary engine -> {"iters": [...],
+    # "lengths": [...], "times": [...]}
+    log = {}
+    with open(filename) as f:
+        next(f)
+        for line in f:
+            engine, iteration, length, seconds = line.strip().split(",")
+            series = log.setdefault(engine, {"iters": [], "lengths": [], "times": []})
+            series["iters"].append(int(iteration))
+            series["lengths"].append(float(length))
+            series["times"].append(float(seconds))
+    return log
+
+def plot_log(filename, image=None, show=True):
+    # plot of minimal tour length vs iteration number for all engines in
+    # the log; plot has log-log-scale; saved to image if given
+    import matplotlib.pyplot as plt
+    log = read_log(filename)
+    colors = {"direct": "red", "simann": "blue"}
+    labels = {"direct": "direct sampling", "simann": "simulated annealing"}
+    xmax = max(series["iters"][-1] for series in log.values())
+    fig = plt.figure(figsize=(10, 10))
+    ax = fig.add_subplot(1, 1, 1)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    for engine in sorted(log):
+        # every line is drawn up to the last iteration of any engine
+        x, y = log[engine]["iters"] + [xmax], log[engine]["lengths"] + [log[engine]["lengths"][-1]]
+        plt.plot(x, y, color=colors.get(engine), lw=2, label=labels.get(engine, engine))
+    plt.legend(loc=3, fontsize=16)
+    plt.xlabel("iteration", fontsize=16)
+    plt.ylabel("minimal tour length", fontsize=16)
+    plt.title("Tour length vs iteration", fontsize=20)
+    if image:
+        plt.savefig(image)
+    if show:
+        plt.show()
+    return image
+
+def plot_in_background(filename, image=None, copy=False):
+    # plot_log() in a separate process, returns at once; with copy the
+    # process gets a copy of the log of its own (deleted when it is done),
+    # so the log may be deleted or go on growing meanwhile (the process
+    # takes a while to start)
+    if copy:
+        fd, copied = tempfile.mkstemp(prefix="TSP_plot_", suffix=".csv")
+        os.close(fd)
+        shutil.copyfile(filename, copied)
+        filename = copied
+    args = [sys.executable, os.path.abspath(__file__), filename]
+    if image:
+        args += ["--image", image]
+    if copy:
+        args += ["--delete"]
+    return subprocess.Popen(args)
+
+
+########################################################################
+# Command line:
+def main():
+    parser = argparse.ArgumentParser(description="TSP: plot convergence log")
+    parser.add_argument("log", help="CSV file written by Recorder")
+    parser.add_argument("--image", help="save plot to this file")
+    parser.add_argument("--no-show", action="store_true", help="only save the plot, don't display it")
+    parser.add_argument("--delete", action="store_true", help="delete the log file when done (a copy made by plot_in_background())")
+    args = parser.parse_args()
+    if args.no_show:
+        import matplotlib
+        matplotlib.use("Agg")
+    try:
+        plot_log(args.log, args.image, not args.no_show)
+    finally:
+        if args.delete:
+            os.remove(args.log)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), spatial index over the city
+# positions: uniform grid, k nearest neighbours of every city (candidate
+# lists for the neighbour moves of simulated annealing) and a tour along
+# a space-filling curve (good starting point for large instances)
+#
+########################################################################
+#
+# Import packages:
+import math
+import numpy as np
+
+########################################################################
+# Global settings:
+NEIGHBOURS = 8       # number of nearest neighbours per city in candidate lists
+PER_CELL = 2.0       # average number of cities per grid cell
+CURVE_ORDER = 16     # number of bits per coordinate for space-filling curve
+
+
+########################################################################
+# Uniform grid, cities are sorted by cell; the cities in cell (cx, cy)
+# are order[start[cy * G + cx]:start[cy * G + cx + 1]]:
+class Grid():
+
+    def __init__(self, cities, per_cell=PER_CELL):
+        N = len(cities)
+        self.x, self.y = cities[:, 0], cities[:, 1]
+        self.G = G = max(1, int(math.sqrt(N / per_cell)))
+        self.x0, self.y0 = self.x.min(), self.y.min()
+        self.h = max(self.x.max() - self.x0, self.y.max() - self.y0, 1e-12) / G  # cell size
+        self.cx = np.minimum(((self.x - self.x0) / self.h).astype(np.intp), G - 1)
+        self.cy = np.minimum(((self.y - self.y0) / self.h).astype(np.intp), G - 1)
+        cell = self.cy * G + self.cx
+        self.order = np.argsort(cell, kind="mergesort")
+        self.start = np.searchsorted(cell[self.order], np.arange(G * G + 1))
+
+    def Block(self, cx, cy, r):
+        # indices of all cities in cells (cx - r ... cx + r, cy - r ... cy + r);
+        # cells of one grid row are contiguous in order
+        G, order, start = self.G, self.order, self.start
+        x1, x2 = max(cx - r, 0), min(cx + r, G - 1)
+        rows = [order[start[row * G + x1]:start[row * G + x2 + 1]] for row in range(max(cy - r, 0), min(cy + r, G - 1) + 1)]
+        return np.concatenate(rows)
+
+
+def nearest_neighbours(cities, k=NEIGHBOURS):
+    # k nearest neighbours of every city, sorted by distance, as array of
+    # shape (N, k); searches growing blocks of grid cells around the cell
+    # of a city until the k-th neighbour is closer than any city outside
+    # of the block can be
+    N = len(cities)
+    k = min(k, N - 1)
+    grid = Grid(cities)
+    G, x, y = grid.G, grid.x, grid.y
+    result = np.empty((N, k), dtype=np.int32)
+    for cell in range(G * G):
+        inside = grid.order[grid.start[cell]:grid.start[cell + 1]]
+        if len(inside) == 0:
+            continue
+        cx, cy = cell % G, cell // G
+        r = 1
+        while True:
+            candidates = grid.Block(cx, cy, r)
+            if len(candidates) > k:
+                d2 = (x[inside, None] - x[candidates]) ** 2 + (y[inside, None] - y[candidates]) ** 2
+                d2[inside[:, None] == candidates] = np.inf  # city itself
+                nearest = np.argpartition(d2, k - 1, axis=1)[:, :k]
+                dk = d2[np.arange(len(inside))[:, None], nearest]
+                if r >= G or dk.max() <= (r * grid.h) ** 2:
+                    break
+            r += 1
+        nearest = nearest[np.arange(len(inside))[:, None], dk.argsort(axis=1)]
+        result[inside] = candidates[nearest]
+    return result
+
+def space_filling_tour(cities, order=CURVE_ORDER):
+    # tour visiting the cities in the order of a Hilbert curve through the
+    # bounding box, some 25-40% longer than the optimal tour for random
+    # cities, computed in O(N log N)
+    x, y = cities[:, 0], cities[:, 1]
+    n = 2 ** order
+    scale = (n - 1) / max(x.max() - x.min(), y.max() - y.min(), 1e-12)
+    xi = ((x - x.min()) * scale).astype(np.int64)
+    yi = ((y - y.min()) * scale).astype(np.int64)
+    d = np.zeros(len(cities), dtype=np.int64)
+    s = n // 2
+    while s > 0:
+        rx = (xi & s) > 0
+        ry = (yi & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate quadrant:
+        flip = ~ry & rx
+        xi = np.where(flip, n - 1 - xi, xi)
+        yi = np.where(flip, n - 1 - yi, yi)
+        swap = ~ry
+        xi, yi = np.where(swap, yi, xi), np.where(swap, xi, yi)
+        s //= 2
+    return np.argsort(d, kind="mergesort")
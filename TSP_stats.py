@@ -0,0 +1,92 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), instrumentation: time spent per
+# phase (event handling, the solvers, drawing), counters (redraws, ...)
+# and the move statistics of the engines (proposed / accepted moves per
+# move type, see CountMoves() of the engines), written periodically as
+# JSON lines; used by the GUI and by headless runs with --stats FILE or
+# with the environment variable TSP_STATS=FILE
+#
+# Without a file the phase times are still summed up (a few dictionary
+# updates per batch of iterations), the engines only count moves when
+# asked to, so there is no cost in their inner loops otherwise.
+#
+########################################################################
+#
+# Import packages:
+import json
+import timeit
+
+########################################################################
+# Global settings:
+INTERVAL = 5.0       # interval (in seconds) between two lines written to the stats file
+
+
+class Stats():
+
+    def __init__(self, filename=None, interval=INTERVAL):
+        self.filename = filename
+        self.file = open(filename, "a") if filename else None
+        self.interval = interval
+        self.start = timeit.default_timer()
+        self.next = self.start + interval
+        self.times = {}
+        self.counts = {}
+        self.engines, self.values = {}, {}
+
+    def Add(self, phase, seconds):
+        # time spent in a phase
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+    def Count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def Record(self, engines, **values):
+        # stats as dictionary: time since start, phase times, counters,
+        # iterations, tour length and moves of every engine (dictionary
+        # name -> engine) and any further values
+        record = {"time": timeit.default_timer() - self.start, "phases": self.times, "counts": self.counts}
+        record.update(values)
+        record["engines"] = {}
+        for name, engine in engines.items():
+            r = {"iters": engine.iters, "best_energy": engine.best_energy, "best_iter": engine.best_iter}
+            if engine.counts is not None:
+                r["moves"] = dict((move, {"proposed": c[0], "accepted": c[1], "rejected": c[0] - c[1], "improved": c[2]})
+                                  for move, c in engine.counts.items())
+            record["engines"][name] = r
+        return record
+
+    def Tick(self, engines, **values):
+        # write stats if the interval has passed since the last time;
+        # engines and values are kept for Dump() and Close()
+        self.engines, self.values = engines, values
+        if self.file is not None and timeit.default_timer() >= self.next:
+            self.Dump()
+
+    def Dump(self, engines=None, **values):
+        if engines is not None:
+            self.engines, self.values = engines, values
+        if self.file is None:
+            return
+        self.file.write(json.dumps(self.Record(self.engines, **self.values), sort_keys=True) + "\n")
+        self.file.flush()
+        self.next = timeit.default_timer() + self.interval
+
+    def Close(self, engines=None, **values):
+        # write final stats and close file
+        self.Dump(engines, **values)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def profile(filename, function, *args):
+    # call function under cProfile and save the profile (view it with
+    # python -m pstats filename); returns the result of the function
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(filename)
+        print "Profile saved, filename:", filename
@@ -0,0 +1,96 @@
+########################################################################
+#
+# TSP (Travelling Salesman Problem), stopping criteria for the solver
+# engines; a run is stopped when
+#
+# - the iteration budget or
+# - the time budget is used up (all engines), or when simulated
+#   annealing has converged:
+# - its best tour hasn't improved for a while (window proportional to
+#   N log N, like the cooling length of the schedules), or
+# - it is frozen: hardly any uphill move is accepted any more (rate
+#   estimated from sampled moves, see TSP_cooling.acceptance(); only for
+#   Metropolis chains, the classic schedule never keeps uphill moves)
+#   and the best tour hasn't improved for a part of that window; a
+#   frozen chain still finds a shorter tour now and then, which
+#   polishing of the best tour at the end mostly makes up for
+#
+# The counted rate of accepted moves is no use here, moves which don't
+# change the tour (e.g. 2-opt moves between neighbours in the tour) are
+# always accepted and dominate it in a frozen chain.
+#
+# The convergence criteria depend on the state of the engine only and
+# are checked at fixed iteration numbers, so a run resumed from a
+# checkpoint stops at the same iteration as an uninterrupted one.
+#
+########################################################################
+#
+# Import packages:
+import math
+import TSP_cooling
+
+########################################################################
+# Global settings:
+STALL = 100.0        # stop annealing if the best tour hasn't improved for STALL * N log(N + 1) iterations (0: never)
+ACCEPT = 1e-4        # stop annealing if a lower fraction of uphill moves is accepted (0: never)
+ACCEPT_EVERY = 20000  # iterations between two estimates of the acceptance probability
+FROZEN = 10.0        # ... and the best tour hasn't improved for FROZEN * N log(N + 1) iterations (a part of the STALL window)
+SAMPLES = 200        # sampled moves per estimate of the acceptance probability
+
+
+class Criteria():
+    # iters and time_budget (seconds) are budgets per engine (None: no
+    # limit), stall and accept are explained above; Check() is called
+    # between runs of the engine
+
+    def __init__(self, iters=None, time_budget=None, stall=STALL, accept=ACCEPT):
+        self.iters, self.time_budget = iters, time_budget
+        self.stall, self.accept = stall, accept
+        self.iters0, self.time0 = 0, 0.0   # budgets count from here, see Restart()
+        self.next = None                   # iteration number of next estimate of acceptance
+        self.acceptance = None             # last estimate
+
+    def Restart(self, engine, elapsed):
+        # all criteria count from now on, e.g. when the user continues a
+        # stopped simulation
+        self.iters0, self.time0 = engine.iters, elapsed
+        self.next = None
+
+    def Budget(self, iters, elapsed):
+        # reason to stop after iters iterations and elapsed seconds if a
+        # budget is used up, None otherwise
+        if self.iters is not None and iters - self.iters0 >= self.iters:
+            return "iteration budget"
+        if self.time_budget is not None and elapsed - self.time0 >= self.time_budget:
+            return "time budget"
+        return None
+
+    def Stalled(self, N, iters, best_iter):
+        # reason to stop if the best tour (found at iteration best_iter) of
+        # N cities hasn't improved for too long, None otherwise
+        if self.stall and iters - max(best_iter, self.iters0) >= self.stall * N * math.log(N + 1):
+            return "no improvement"
+        return None
+
+    def Check(self, engine, elapsed):
+        # reason to stop the engine (after elapsed seconds) or None
+        reason = self.Budget(engine.iters, elapsed)
+        if reason or getattr(engine, "schedule", None) is None:
+            # only simulated annealing converges
+            return reason
+        reason = self.Stalled(engine.N, engine.iters, engine.best_iter)
+        if reason:
+            return reason
+        if self.accept and engine.keep_uphill:
+            if self.next is None:
+                # first estimate at the next multiple of ACCEPT_EVERY, or
+                # right away if one is due now (e.g. after a resume); the
+                # estimate doesn't change the engine, so repeating one is
+                # harmless
+                self.next = max(ACCEPT_EVERY, -(-engine.iters // ACCEPT_EVERY) * ACCEPT_EVERY)
+            if engine.iters >= self.next:
+                self.next = (engine.iters // ACCEPT_EVERY + 1) * ACCEPT_EVERY
+                self.acceptance = TSP_cooling.acceptance(engine, SAMPLES)
+                if self.acceptance < self.accept and engine.iters - max(engine.best_iter, self.iters0) >= FROZEN * engine.N * math.log(engine.N + 1):
+                    return "frozen"
+        return None